@@ -80,12 +80,14 @@ class Settings(BaseSettings):
     MONGODB_AUTH_SOURCE: str = "admin"
     MONGODB_CONNECTION_STRING: Optional[str] = None
     DATABASE_NAME: str = "tradingagents"
+    MONGODB_MAX_POOL_SIZE: int = 100
     
     # Redis Configuration
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: Optional[str] = None
     REDIS_DB: int = 0
+    REDIS_MAX_CONNECTIONS: int = 100
     
     # Cost Tracking
     COST_ALERT_THRESHOLD: float = 100.0
@@ -13,6 +13,12 @@ from backend.models.analysis import AnalysisResult
 
 logger = logging.getLogger(__name__)
 
+# 旧版结果特有的字段，转换回旧版格式时从 raw_data['original_format'] 中恢复
+LEGACY_SPECIFIC_FIELDS = (
+    'analyst_opinions', 'market_sentiment', 'trading_signals',
+    'price_targets', 'recommendations', 'confidence_scores'
+)
+
 
 class ResultFormatCompatibility:
     """结果格式兼容性管理器"""
@@ -115,12 +121,7 @@ class ResultFormatCompatibility:
                 original = new_result.raw_data['original_format']
                 if isinstance(original, dict):
                     # 恢复旧版特有的字段
-                    legacy_specific_fields = [
-                        'analyst_opinions', 'market_sentiment', 'trading_signals',
-                        'price_targets', 'recommendations', 'confidence_scores'
-                    ]
-                    
-                    for field in legacy_specific_fields:
+                    for field in LEGACY_SPECIFIC_FIELDS:
                         if field in original:
                             legacy_result[field] = original[field]
             
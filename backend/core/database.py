@@ -20,7 +20,10 @@ class DatabaseManager:
     async def connect(self):
         """Connect to MongoDB"""
         try:
-            self.client = AsyncIOMotorClient(settings.MONGODB_URL)
+            self.client = AsyncIOMotorClient(
+                settings.MONGODB_URL,
+                maxPoolSize=settings.MONGODB_MAX_POOL_SIZE
+            )
             self.database = self.client[settings.MONGODB_DB_NAME]
             
             # Test connection
@@ -66,7 +69,8 @@ class CacheManager:
             self.redis = redis.from_url(
                 settings.REDIS_URL,
                 encoding="utf-8",
-                decode_responses=True
+                decode_responses=True,
+                max_connections=settings.REDIS_MAX_CONNECTIONS
             )
             
             # Test connection
@@ -8,60 +8,249 @@ import os
 import sys
 import json
 import asyncio
+import hashlib
 import pickle
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple, Iterator, Union
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+import orjson
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-from backend.models.analysis import AnalysisResult
+from backend.models.analysis import AnalysisResult, MarketType
+from backend.core.compatibility.result_format_compatibility import LEGACY_SPECIFIC_FIELDS
+from backend.app.config import settings
 from backend.core.database import get_database
 from backend.core.redis_client import get_redis_client
 
+from bulk import AsyncBulkWriter, DEFAULT_BATCH_SIZE
+
+# 迁移后的缓存键前缀；对应的值为UTF-8 JSON文本，应用通过 decode_responses=True 的客户端读取
+MIGRATED_CACHE_PREFIX = "migrated_cache:"
+MIGRATED_CACHE_TTL = 3600 * 24 * 7  # 7天过期
+
+# 已成功迁移的文件路径集合（Redis SET），重复运行时据此跳过，支持断点续迁
+PROCESSED_FILES_KEY = "migrated:processed_files"
+# 已迁移的缓存文件单独记录：迁移后的缓存值会过期，该集合设置相同的TTL，
+# 集合在其中任何缓存值过期之前过期，过期后的缓存文件会重新迁移
+PROCESSED_CACHE_FILES_KEY = "migrated:processed_cache_files"
+CHECKPOINT_BATCH_SIZE = 500
+
+# 逐文件日志降为DEBUG，每迁移这么多条输出一次INFO进度汇总
+PROGRESS_LOG_INTERVAL = 1000
+
+
+def _loads_json(raw_bytes: bytes) -> Any:
+    """解析JSON字节，orjson 拒绝时改用标准库 json
+    
+    json.dump 默认写出 NaN/Infinity/-Infinity，orjson 不接受这些值，
+    这类文件由 json.loads 解析，与迁移前的读取方式一致。
+    """
+    try:
+        return orjson.loads(raw_bytes)
+    except orjson.JSONDecodeError:
+        return json.loads(raw_bytes)
+
+
+def _load_json(path: Path) -> Any:
+    return _loads_json(path.read_bytes())
+
+
+def _load_pickle(path: Path) -> Any:
+    # 直接从文件流反序列化，不在内存中额外保留一份完整的pickle字节
+    with open(path, 'rb') as f:
+        return pickle.Unpickler(f).load()
+
+
+def _read_result_file(path: Path) -> Tuple[Any, str]:
+    """读取结果文件，返回解析后的数据和 SHA-256 校验和
+    
+    文件只读取一次：同一份字节既用于解析也用于计算校验和，
+    hashlib.sha256 由 OpenSSL 实现，可利用 CPU 的 SHA 扩展指令。
+    """
+    raw_bytes = path.read_bytes()
+    # 结果中的浮点数多来自 pandas/numpy，NaN 很常见，由 _loads_json 回退到标准库解析
+    return _loads_json(raw_bytes), hashlib.sha256(raw_bytes).hexdigest()
+
+
+def _scan_files(root: Path, suffix: str) -> Iterator[Tuple[Path, datetime, int]]:
+    """递归遍历目录下指定扩展名的文件，返回 (路径, 修改时间(本地时间), 文件大小)
+    
+    基于 os.scandir，目录项类型信息无需额外系统调用，每个文件只 stat 一次。
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(suffix) and entry.is_file():
+                    st = entry.stat()
+                    yield Path(entry.path), datetime.fromtimestamp(st.st_mtime), st.st_size
+
+
+# 缓存文件扩展名 -> 加载函数，不在表中的文件类型直接跳过
+_LOADERS = {
+    ".json": _load_json,
+    ".pkl": _load_pickle,
+}
+
+
+@lru_cache(maxsize=4096)
+def _classify_market_type(stock_code: str) -> MarketType:
+    """按股票代码分类市场；同一代码会在大量结果文件中重复出现，结果按代码缓存"""
+    if not stock_code:
+        return MarketType.CN
+    
+    stock_code = stock_code.upper()
+    
+    # 港股
+    if stock_code.startswith('HK') or (stock_code.isdigit() and len(stock_code) == 5):
+        return MarketType.HK
+    
+    # 美股
+    if stock_code.isalpha() and len(stock_code) <= 5:
+        return MarketType.US
+    
+    # 默认A股
+    return MarketType.CN
+
 
-@dataclass
+@dataclass(slots=True)
 class AnalysisResultsMigrationStats:
     """分析结果迁移统计信息"""
     results_migrated: int = 0
     cache_entries_migrated: int = 0
     reports_migrated: int = 0
-    errors: List[str] = None
-    
-    def __post_init__(self):
-        if self.errors is None:
-            self.errors = []
+    errors: List[str] = field(default_factory=list)
 
 
 class AnalysisResultsMigrator:
     """分析结果迁移器"""
     
-    def __init__(self, data_dir: Path = None):
+    def __init__(self, data_dir: Path = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 client=None, redis_client=None):
         self.logger = logging.getLogger(__name__)
         self.data_dir = data_dir or project_root / "data"
+        # 批量写入大小：分析结果新记录与更新合计达到该数量时提交，报告写入器同样使用
+        self.batch_size = batch_size
         self.stats = AnalysisResultsMigrationStats()
+        # 整个迁移过程共享的长连接（连接池），由 __aenter__ 或首次迁移时获取
+        # 传入 client / redis_client 时使用调用方共享的客户端，其生命周期由调用方管理
+        self.client = client
+        self.db = None
+        self.redis = redis_client
+        self._owns_redis = redis_client is None
+        # 断点续迁：已处理文件集合及待写入Redis的新增路径
+        self._processed_files: set = set()
+        self._pending_checkpoints: Dict[str, List[str]] = {}  # 断点集合键 -> 待写入的路径
+        # 待批量写入的分析结果：股票代码 -> (新文档, 来源文件)，记录ID -> (result_data, 来源文件)
+        self._new_analyses: Dict[str, Tuple[Dict[str, Any], List[str]]] = {}
+        self._analysis_updates: Dict[Any, Tuple[Dict[str, Any], List[str]]] = {}
+        self._default_user_id = None
+    
+    async def __aenter__(self) -> "AnalysisResultsMigrator":
+        await self._ensure_connections()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self.redis is not None and self._owns_redis:
+            await self.redis.aclose()
+            self.redis = None
+        # 数据库来自调用方传入的 client 或进程共享的 db_manager，本类没有创建Mongo客户端，只释放引用；
+        # 关闭 db.client 会关闭其他代码仍在使用的共享连接池
+        self.db = None
+    
+    async def _ensure_connections(self) -> None:
+        """获取数据库和Redis连接，已持有时直接复用"""
+        if self.db is None:
+            if self.client is not None:
+                self.db = self.client[settings.MONGODB_DB_NAME]
+            else:
+                self.db = await get_database()
+        if self.redis is None:
+            self.redis = await get_redis_client()
+    
+    async def _load_processed_files(self) -> None:
+        """加载之前运行中已成功迁移的文件路径"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.smembers(PROCESSED_FILES_KEY)
+        pipe.smembers(PROCESSED_CACHE_FILES_KEY)
+        member_sets = await pipe.execute()
+        self._processed_files = {
+            m.decode('utf-8') if isinstance(m, bytes) else m
+            for members in member_sets for m in members
+        }
+        if self._processed_files:
+            self.logger.info(f"已迁移文件 {len(self._processed_files)} 个，将跳过")
+    
+    async def _mark_processed(self, path: Union[Path, str], key: str = PROCESSED_FILES_KEY) -> None:
+        """记录成功迁移的文件，攒够一批后写入Redis"""
+        pending = self._pending_checkpoints.setdefault(key, [])
+        pending.append(str(path))
+        if len(pending) >= CHECKPOINT_BATCH_SIZE:
+            await self._flush_checkpoints()
+    
+    async def _flush_checkpoints(self) -> None:
+        """将待写入的已处理路径批量SADD到Redis
+        
+        缓存文件集合第一次创建时设置 MIGRATED_CACHE_TTL，之后不再延长：
+        后加入的路径对应的缓存值都比集合晚过期，集合过期时不会留下已过期缓存的断点。
+        """
+        pending = {key: paths for key, paths in self._pending_checkpoints.items() if paths}
+        if not pending:
+            return
+        self._pending_checkpoints = {}
         
-    async def migrate_all_results(self) -> AnalysisResultsMigrationStats:
-        """迁移所有分析结果数据"""
+        pipe = self.redis.pipeline(transaction=False)
+        for key, paths in pending.items():
+            pipe.sadd(key, *paths)
+        if PROCESSED_CACHE_FILES_KEY in pending:
+            pipe.ttl(PROCESSED_CACHE_FILES_KEY)
+        replies = await pipe.execute()
+        # TTL 为 -1 表示集合刚由本次 SADD 创建，还没有过期时间
+        if PROCESSED_CACHE_FILES_KEY in pending and replies[-1] == -1:
+            await self.redis.expire(PROCESSED_CACHE_FILES_KEY, MIGRATED_CACHE_TTL)
+        
+        for paths in pending.values():
+            self._processed_files.update(paths)
+    
+    def _log_progress(self, label: str, count: int) -> None:
+        """每 PROGRESS_LOG_INTERVAL 条输出一次INFO进度"""
+        if count % PROGRESS_LOG_INTERVAL == 0:
+            self.logger.info(f"{label}: {count}")
+        
+    async def migrate_all_results(self, depends_on: Optional[asyncio.Future] = None) -> AnalysisResultsMigrationStats:
+        """迁移所有分析结果数据
+        
+        depends_on: 并发运行时需要先完成的任务（如Streamlit数据迁移）。分析结果会更新
+        该任务创建的分析记录，因此只有这一步等待它，缓存和报告迁移不受影响。
+        """
         self.logger.info("开始迁移分析结果数据...")
         
         try:
             # 获取数据库和Redis连接
-            db = await get_database()
-            redis_client = await get_redis_client()
+            await self._ensure_connections()
+            await self._load_processed_files()
             
-            # 1. 迁移分析结果文件
-            await self._migrate_analysis_results(db)
+            # 1. 迁移缓存数据
+            await self._migrate_cache_data()
             
-            # 2. 迁移缓存数据
-            await self._migrate_cache_data(redis_client)
+            # 2. 迁移报告文件
+            await self._migrate_reports()
             
-            # 3. 迁移报告文件
-            await self._migrate_reports(db)
+            # 3. 迁移分析结果文件
+            if depends_on is not None:
+                await asyncio.wait([depends_on])
+            await self._migrate_analysis_results()
             
             self.logger.info(f"分析结果迁移完成: {self.stats}")
             
@@ -71,7 +260,7 @@ class AnalysisResultsMigrator:
             
         return self.stats
     
-    async def _migrate_analysis_results(self, db) -> None:
+    async def _migrate_analysis_results(self) -> None:
         """迁移分析结果文件"""
         self.logger.info("开始迁移分析结果文件...")
         
@@ -81,27 +270,35 @@ class AnalysisResultsMigrator:
                 self.logger.warning(f"分析结果目录不存在: {results_dir}")
                 return
             
-            analyses_collection = db.analyses
+            analyses_collection = self.db.analyses
             
             # 遍历所有结果文件
-            for result_file in results_dir.rglob("*.json"):
+            for result_file, mtime, _ in _scan_files(results_dir, ".json"):
+                if str(result_file) in self._processed_files:
+                    continue
                 try:
-                    await self._process_result_file(result_file, analyses_collection)
+                    await self._process_result_file(result_file, mtime, analyses_collection)
                 except Exception as e:
                     error_msg = f"处理结果文件失败 {result_file}: {str(e)}"
                     self.logger.error(error_msg)
                     self.stats.errors.append(error_msg)
+                
+                if len(self._new_analyses) + len(self._analysis_updates) >= self.batch_size:
+                    await self._flush_analysis_writes(analyses_collection)
+            
+            await self._flush_analysis_writes(analyses_collection)
+            await self._flush_checkpoints()
                     
         except Exception as e:
             error_msg = f"分析结果迁移失败: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
     
-    async def _process_result_file(self, result_file: Path, analyses_collection) -> None:
-        """处理单个结果文件"""
+    async def _process_result_file(self, result_file: Path, mtime: datetime,
+                                   analyses_collection) -> bool:
+        """处理单个结果文件，转换后的结果加入待写入批次，成功返回True"""
         try:
-            with open(result_file, 'r', encoding='utf-8') as f:
-                result_data = json.load(f)
+            result_data, digest = await asyncio.to_thread(_read_result_file, result_file)
             
             # 从文件名或数据中提取股票代码和时间戳
             stock_code = self._extract_stock_code_from_filename(result_file.name)
@@ -109,7 +306,9 @@ class AnalysisResultsMigrator:
                 stock_code = result_data.get('stock_code', 'UNKNOWN')
             
             # 转换结果数据格式
-            converted_result = await self._convert_result_format(result_data)
+            converted_result = await self._convert_result_format(
+                result_data, str(result_file), digest
+            )
             
             # 查找对应的分析记录
             analysis_record = await analyses_collection.find_one({
@@ -117,41 +316,24 @@ class AnalysisResultsMigrator:
                 "status": "completed"
             }, sort=[("created_at", -1)])  # 获取最新的完成记录
             
+            source = str(result_file)
             if analysis_record:
-                # 更新现有记录的结果数据
-                await analyses_collection.update_one(
-                    {"_id": analysis_record["_id"]},
-                    {"$set": {"result_data": converted_result.dict()}}
-                )
-                self.stats.results_migrated += 1
-                self.logger.info(f"更新分析结果: {stock_code}")
+                # 更新现有记录的结果数据（同一批次内后处理的文件覆盖先处理的）
+                record_id = analysis_record["_id"]
+                _, sources = self._analysis_updates.get(record_id, (None, []))
+                self._analysis_updates[record_id] = (converted_result.dict(), sources + [source])
+                self.logger.debug(f"更新分析结果: {stock_code}")
+            elif stock_code in self._new_analyses:
+                # 本批次已为该股票创建了新记录，只更新其结果数据
+                analysis_doc, sources = self._new_analyses[stock_code]
+                analysis_doc["result_data"] = converted_result.dict()
+                sources.append(source)
+                self.logger.debug(f"更新分析结果: {stock_code}")
             else:
                 # 创建新的分析记录（如果没有找到对应记录）
-                from backend.models.analysis import AnalysisInDB, AnalysisStatus, MarketType
-                from bson import ObjectId
+                from backend.models.analysis import AnalysisInDB, AnalysisStatus
                 
-                # 创建默认用户ID（需要先确保有默认用户）
-                default_user = await analyses_collection.database.users.find_one({"username": "migrated_user"})
-                if not default_user:
-                    # 创建迁移用户
-                    from backend.models.user import UserInDB, UserRole
-                    from backend.utils.security import get_password_hash
-                    
-                    migrated_user = UserInDB(
-                        username="migrated_user",
-                        email="migrated@example.com",
-                        role=UserRole.USER,
-                        password_hash=get_password_hash("changeme123"),
-                        created_at=datetime.utcnow(),
-                        is_active=True
-                    )
-                    
-                    result = await analyses_collection.database.users.insert_one(
-                        migrated_user.dict(by_alias=True)
-                    )
-                    default_user_id = result.inserted_id
-                else:
-                    default_user_id = default_user["_id"]
+                default_user_id = await self._get_default_user_id(analyses_collection.database.users)
                 
                 # 创建分析记录
                 analysis_doc = AnalysisInDB(
@@ -162,18 +344,108 @@ class AnalysisResultsMigrator:
                     progress=100.0,
                     config={"migrated_from_file": str(result_file)},
                     result_data=converted_result,
-                    created_at=datetime.fromtimestamp(result_file.stat().st_mtime),
-                    completed_at=datetime.fromtimestamp(result_file.stat().st_mtime)
+                    created_at=mtime,
+                    completed_at=mtime
                 )
                 
-                await analyses_collection.insert_one(analysis_doc.dict(by_alias=True))
-                self.stats.results_migrated += 1
-                self.logger.info(f"创建新分析记录: {stock_code}")
+                self._new_analyses[stock_code] = (analysis_doc.dict(by_alias=True), [source])
+                self.logger.debug(f"创建新分析记录: {stock_code}")
+            
+            return True
                 
         except Exception as e:
             error_msg = f"处理结果文件失败 {result_file}: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
+            return False
+    
+    async def _get_default_user_id(self, users_collection):
+        """获取迁移默认用户ID（不存在时创建），结果在整个迁移过程中复用"""
+        if self._default_user_id is not None:
+            return self._default_user_id
+        
+        default_user = await users_collection.find_one({"username": "migrated_user"})
+        if not default_user:
+            # 创建迁移用户
+            from backend.models.user import UserInDB, UserRole
+            from backend.utils.security import get_password_hash
+            
+            migrated_user = UserInDB(
+                username="migrated_user",
+                email="migrated@example.com",
+                role=UserRole.USER,
+                password_hash=get_password_hash("changeme123"),
+                created_at=datetime.utcnow(),
+                is_active=True
+            )
+            
+            result = await users_collection.insert_one(migrated_user.dict(by_alias=True))
+            self._default_user_id = result.inserted_id
+        else:
+            self._default_user_id = default_user["_id"]
+        
+        return self._default_user_id
+    
+    async def _flush_analysis_writes(self, analyses_collection) -> None:
+        """提交累积的分析结果写入
+        
+        新记录之间没有依赖，用 insert_many(ordered=False) 写入；已有记录的更新用
+        bulk_write(ordered=False)，两者并发执行。写入成功的来源文件才记录为已迁移。
+        """
+        new_items = list(self._new_analyses.values())
+        update_items = list(self._analysis_updates.items())
+        self._new_analyses = {}
+        self._analysis_updates = {}
+        
+        writes = []
+        if new_items:
+            writes.append(self._execute_analysis_batch(
+                analyses_collection.insert_many(
+                    [doc for doc, _ in new_items], ordered=False
+                ),
+                [sources for _, sources in new_items]
+            ))
+        if update_items:
+            writes.append(self._execute_analysis_batch(
+                analyses_collection.bulk_write(
+                    [
+                        UpdateOne({"_id": record_id}, {"$set": {"result_data": result_data}})
+                        for record_id, (result_data, _) in update_items
+                    ],
+                    ordered=False
+                ),
+                [sources for _, (_, sources) in update_items]
+            ))
+        if not writes:
+            return
+        
+        await asyncio.gather(*writes)
+        self.logger.info(f"已迁移分析结果: {self.stats.results_migrated}")
+    
+    async def _execute_analysis_batch(self, operation, sources_per_item: List[List[str]]) -> None:
+        """执行一个批量写入操作，并按条目记录成功的来源文件"""
+        try:
+            await operation
+            failed_indexes = set()
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            failed_indexes = {err['index'] for err in write_errors}
+            for err in write_errors:
+                error_msg = f"写入分析结果失败 {sources_per_item[err['index']]}: {err.get('errmsg')}"
+                self.logger.error(error_msg)
+                self.stats.errors.append(error_msg)
+        except Exception as e:
+            failed_indexes = set(range(len(sources_per_item)))
+            error_msg = f"批量写入分析结果失败: {str(e)}"
+            self.logger.error(error_msg)
+            self.stats.errors.append(error_msg)
+        
+        for index, sources in enumerate(sources_per_item):
+            if index in failed_indexes:
+                continue
+            self.stats.results_migrated += len(sources)
+            for source in sources:
+                await self._mark_processed(source)
     
     def _extract_stock_code_from_filename(self, filename: str) -> Optional[str]:
         """从文件名中提取股票代码"""
@@ -197,26 +469,22 @@ class AnalysisResultsMigrator:
     
     def _detect_market_type(self, stock_code: str):
         """检测市场类型"""
-        from backend.models.analysis import MarketType
-        
-        if not stock_code:
-            return MarketType.CN
-        
-        stock_code = stock_code.upper()
-        
-        # 港股
-        if stock_code.startswith('HK') or (stock_code.isdigit() and len(stock_code) == 5):
-            return MarketType.HK
+        return _classify_market_type(stock_code)
+    
+    async def _convert_result_format(self, old_result: Dict[str, Any],
+                                     source_path: str, digest: str) -> AnalysisResult:
+        """转换结果数据格式
         
-        # 美股
-        if stock_code.isalpha() and len(stock_code) <= 5:
-            return MarketType.US
+        原始文件保留在磁盘上，raw_data 中只记录来源路径和 SHA-256 校验和，
+        original_format 仅保留兼容层转换回旧版格式时需要的旧版特有字段。
+        """
+        source_info = {'source_path': source_path, 'sha256': digest}
+        legacy_fields = {
+            field: old_result[field] for field in LEGACY_SPECIFIC_FIELDS if field in old_result
+        }
+        if legacy_fields:
+            source_info['original_format'] = legacy_fields
         
-        # 默认A股
-        return MarketType.CN
-    
-    async def _convert_result_format(self, old_result: Dict[str, Any]) -> AnalysisResult:
-        """转换结果数据格式"""
         try:
             # 创建新格式的分析结果
             converted_result = AnalysisResult()
@@ -248,9 +516,9 @@ class AnalysisResultsMigrator:
             if 'charts' in old_result:
                 converted_result.charts = old_result['charts']
             
-            # 保存原始数据
+            # 记录原始数据来源
             converted_result.raw_data = {
-                'original_format': old_result,
+                **source_info,
                 'migrated_at': datetime.utcnow().isoformat()
             }
             
@@ -258,10 +526,10 @@ class AnalysisResultsMigrator:
             
         except Exception as e:
             self.logger.error(f"转换结果格式失败: {e}")
-            # 返回包含原始数据的结果
-            return AnalysisResult(raw_data={'original_format': old_result})
+            # 返回仅包含原始数据来源的结果
+            return AnalysisResult(raw_data=source_info)
     
-    async def _migrate_cache_data(self, redis_client) -> None:
+    async def _migrate_cache_data(self) -> None:
         """迁移缓存数据"""
         self.logger.info("开始迁移缓存数据...")
         
@@ -273,52 +541,58 @@ class AnalysisResultsMigrator:
             
             # 遍历缓存文件
             for cache_file in cache_dir.rglob("*"):
-                if cache_file.is_file():
+                # 先按扩展名过滤，避免对不支持的文件做 stat
+                if cache_file.suffix in _LOADERS and cache_file.is_file():
+                    if str(cache_file) in self._processed_files:
+                        continue
                     try:
-                        await self._process_cache_file(cache_file, redis_client)
+                        if await self._process_cache_file(cache_file, self.redis):
+                            await self._mark_processed(cache_file, PROCESSED_CACHE_FILES_KEY)
                     except Exception as e:
                         error_msg = f"处理缓存文件失败 {cache_file}: {str(e)}"
                         self.logger.error(error_msg)
                         self.stats.errors.append(error_msg)
+            
+            await self._flush_checkpoints()
                         
         except Exception as e:
             error_msg = f"缓存数据迁移失败: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
     
-    async def _process_cache_file(self, cache_file: Path, redis_client) -> None:
-        """处理单个缓存文件"""
+    async def _process_cache_file(self, cache_file: Path, redis_client) -> bool:
+        """处理单个缓存文件，成功返回True"""
         try:
-            # 根据文件扩展名处理不同类型的缓存文件
-            if cache_file.suffix == '.json':
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-            elif cache_file.suffix == '.pkl':
-                with open(cache_file, 'rb') as f:
-                    cache_data = pickle.load(f)
-            else:
-                # 跳过不支持的文件类型
-                return
+            # 根据文件扩展名选择加载函数，跳过不支持的文件类型
+            loader = _LOADERS.get(cache_file.suffix)
+            if loader is None:
+                return False
+            
+            cache_data = await asyncio.to_thread(loader, cache_file)
             
             # 生成Redis键名
-            cache_key = f"migrated_cache:{cache_file.stem}"
+            cache_key = f"{MIGRATED_CACHE_PREFIX}{cache_file.stem}"
             
-            # 存储到Redis
-            await redis_client.setex(
-                cache_key,
-                3600 * 24 * 7,  # 7天过期
-                json.dumps(cache_data, default=str, ensure_ascii=False)
-            )
+            # 以JSON文本存储到Redis：应用的Redis客户端按UTF-8解码响应，不能读取二进制编码。
+            # 使用标准库 json：pickle 缓存中的字典可能有非字符串键，浮点数可能是 NaN/Infinity，
+            # json.dumps 会把键转为字符串并原样写出 NaN，orjson 对前者报错、把后者写成 null
+            payload = json.dumps(cache_data, default=str, ensure_ascii=False)
+            # 重新编码后立即释放反序列化出的对象，降低大缓存文件的内存峰值
+            del cache_data
+            await redis_client.setex(cache_key, MIGRATED_CACHE_TTL, payload)
             
             self.stats.cache_entries_migrated += 1
-            self.logger.info(f"迁移缓存文件: {cache_file.name}")
+            self.logger.debug(f"迁移缓存文件: {cache_file.name}")
+            self._log_progress("已迁移缓存条目", self.stats.cache_entries_migrated)
+            return True
             
         except Exception as e:
             error_msg = f"处理缓存文件失败 {cache_file}: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
+            return False
     
-    async def _migrate_reports(self, db) -> None:
+    async def _migrate_reports(self) -> None:
         """迁移报告文件"""
         self.logger.info("开始迁移报告文件...")
         
@@ -328,54 +602,72 @@ class AnalysisResultsMigrator:
                 self.logger.warning(f"报告目录不存在: {reports_dir}")
                 return
             
-            # 创建报告集合（如果需要的话）
-            reports_collection = db.reports
+            # 创建报告集合（如果需要的话），报告记录批量upsert写入
+            reports_writer = AsyncBulkWriter(self.db.reports, self.batch_size)
+            queued_reports: List[Path] = []
             
             # 遍历报告文件
-            for report_file in reports_dir.rglob("*.md"):
+            for report_file, mtime, size in _scan_files(reports_dir, ".md"):
+                if str(report_file) in self._processed_files:
+                    continue
                 try:
-                    await self._process_report_file(report_file, reports_collection)
+                    if await self._process_report_file(report_file, mtime, size,
+                                                       reports_writer):
+                        queued_reports.append(report_file)
                 except Exception as e:
                     error_msg = f"处理报告文件失败 {report_file}: {str(e)}"
                     self.logger.error(error_msg)
                     self.stats.errors.append(error_msg)
+            
+            await reports_writer.aclose()
+            self.stats.reports_migrated += reports_writer.upserted_count
+            self.logger.info(f"已迁移报告: {self.stats.reports_migrated}")
+            
+            # upsert是幂等的：只有全部写入成功才记录断点，否则下次运行重新处理这些报告
+            if reports_writer.errors:
+                self.stats.errors.extend(reports_writer.errors)
+            else:
+                for report_file in queued_reports:
+                    await self._mark_processed(report_file)
+            await self._flush_checkpoints()
                     
         except Exception as e:
             error_msg = f"报告迁移失败: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
     
-    async def _process_report_file(self, report_file: Path, reports_collection) -> None:
-        """处理单个报告文件"""
+    async def _process_report_file(self, report_file: Path, mtime: datetime, size: int,
+                                   reports_writer: AsyncBulkWriter) -> bool:
+        """处理单个报告文件，报告记录交给批量写入器，成功返回True"""
         try:
-            with open(report_file, 'r', encoding='utf-8') as f:
-                report_content = f.read()
+            # 读取和UTF-8解码在线程中执行，不阻塞事件循环上的数据库写入
+            report_content = await asyncio.to_thread(report_file.read_text, encoding='utf-8')
             
             # 创建报告记录
             report_doc = {
                 'filename': report_file.name,
                 'content': report_content,
                 'file_path': str(report_file),
-                'created_at': datetime.fromtimestamp(report_file.stat().st_mtime),
+                'created_at': mtime,
                 'migrated_at': datetime.utcnow(),
-                'file_size': report_file.stat().st_size
+                'file_size': size
             }
             
-            # 检查是否已存在
-            existing_report = await reports_collection.find_one({
-                'filename': report_file.name,
-                'file_path': str(report_file)
-            })
+            # 以 (文件名, 文件路径) 为键upsert，已存在的报告不做修改
+            await reports_writer.submit(UpdateOne(
+                {'filename': report_file.name, 'file_path': str(report_file)},
+                {'$setOnInsert': report_doc},
+                upsert=True
+            ))
+            self.logger.debug(f"迁移报告文件: {report_file.name}")
             
-            if not existing_report:
-                await reports_collection.insert_one(report_doc)
-                self.stats.reports_migrated += 1
-                self.logger.info(f"迁移报告文件: {report_file.name}")
+            return True
             
         except Exception as e:
             error_msg = f"处理报告文件失败 {report_file}: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
+            return False
     
     async def validate_migration(self) -> Dict[str, Any]:
         """验证迁移结果"""
@@ -389,8 +681,9 @@ class AnalysisResultsMigrator:
         }
         
         try:
-            db = await get_database()
-            redis_client = await get_redis_client()
+            await self._ensure_connections()
+            db = self.db
+            redis_client = self.redis
             
             # 验证分析结果
             analyses_with_results = await db.analyses.count_documents({
@@ -399,7 +692,7 @@ class AnalysisResultsMigrator:
             validation_results['analyses_with_results'] = analyses_with_results
             
             # 验证缓存条目
-            cache_keys = await redis_client.keys("migrated_cache:*")
+            cache_keys = await redis_client.keys(f"{MIGRATED_CACHE_PREFIX}*")
             validation_results['cache_entries'] = len(cache_keys)
             
             # 验证报告
@@ -424,10 +717,12 @@ async def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
-    migrator = AnalysisResultsMigrator()
-    
-    # 执行迁移
-    stats = await migrator.migrate_all_results()
+    async with AnalysisResultsMigrator() as migrator:
+        # 执行迁移
+        stats = await migrator.migrate_all_results()
+        
+        # 验证迁移结果
+        validation_results = await migrator.validate_migration()
     
     print("\n=== 分析结果迁移统计 ===")
     print(f"结果文件迁移数量: {stats.results_migrated}")
@@ -439,9 +734,6 @@ async def main():
         for error in stats.errors[:10]:
             print(f"  - {error}")
     
-    # 验证迁移结果
-    validation_results = await migrator.validate_migration()
-    
     print("\n=== 验证结果 ===")
     print(f"包含结果的分析记录: {validation_results['analyses_with_results']}")
     print(f"缓存条目数量: {validation_results['cache_entries']}")
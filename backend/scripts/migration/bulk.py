@@ -0,0 +1,92 @@
+"""
+MongoDB批量写入工具
+迁移脚本累积写操作后按批提交，避免逐条 insert_one/update_one 的网络往返
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Set
+
+from pymongo.errors import BulkWriteError
+
+# 迁移脚本默认的批量写入大小，可通过 run_migration.py --batch-size 调整
+DEFAULT_BATCH_SIZE = 1000
+
+
+class AsyncBulkWriter:
+    """异步批量写入器
+
+    submit() 累积 InsertOne/UpdateOne 等写操作，达到 batch_size 时以
+    bulk_write(ordered=False) 提交一次；aclose() 提交剩余的操作并等待所有批次完成。
+    单条写入失败记录在 errors 中，不影响同批次的其他操作。
+
+    批次在后台任务中写入，最多 max_concurrency 个批次同时进行，调用方在写入期间
+    可以继续准备后续操作；达到上限时 submit() 等待有批次完成。
+    max_concurrency 大于1时批次之间的执行顺序不确定，各批次的操作应当互不依赖。
+    """
+
+    def __init__(self, collection, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_concurrency: int = 1):
+        self.logger = logging.getLogger(__name__)
+        self.collection = collection
+        self.batch_size = batch_size
+        self._ops: List[Any] = []
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: Set[asyncio.Task] = set()
+        self.inserted_count = 0
+        self.upserted_count = 0
+        self.modified_count = 0
+        self.errors: List[str] = []
+
+    async def __aenter__(self) -> "AsyncBulkWriter":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    async def submit(self, op) -> None:
+        """加入一个写操作，累积满一批时提交"""
+        self._ops.append(op)
+        if len(self._ops) >= self.batch_size:
+            await self._flush()
+
+    async def aclose(self) -> None:
+        """提交所有未写入的操作，并等待进行中的批次完成"""
+        await self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight)
+
+    async def _flush(self) -> None:
+        if not self._ops:
+            return
+
+        ops = self._ops
+        self._ops = []
+        # 进行中的批次达到上限时在此等待，限制内存中未确认的批次数量
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._write(ops))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _write(self, ops: List[Any]) -> None:
+        try:
+            result = await self.collection.bulk_write(ops, ordered=False)
+            self._record(result.bulk_api_result)
+        except BulkWriteError as e:
+            self._record(e.details)
+            for err in e.details.get('writeErrors', []):
+                error_msg = f"批量写入 {self.collection.name} 失败: {err.get('errmsg')}"
+                self.logger.error(error_msg)
+                self.errors.append(error_msg)
+        except Exception as e:
+            # 批次在后台任务中写入，连接错误等异常必须记录到 errors，否则调用方会把未写入的数据当作已完成
+            error_msg = f"批量写入 {self.collection.name} 失败（{len(ops)} 个操作未写入）: {e}"
+            self.logger.error(error_msg)
+            self.errors.append(error_msg)
+        finally:
+            self._semaphore.release()
+
+    def _record(self, details: Dict[str, Any]) -> None:
+        self.inserted_count += details.get('nInserted', 0)
+        self.upserted_count += details.get('nUpserted', 0)
+        self.modified_count += details.get('nModified', 0)
@@ -4,108 +4,280 @@
 统一执行所有数据迁移任务
 """
 
+import io
 import os
 import sys
+import json
+import subprocess
 import asyncio
 import argparse
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+import time
 import logging
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Dict, IO, Optional
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from backend.app.config import settings
 from streamlit_data_migrator import StreamlitDataMigrator
 from analysis_results_migrator import AnalysisResultsMigrator
+from bulk import DEFAULT_BATCH_SIZE
+
+try:
+    from backend.core.redis_client import get_redis_client
+except ImportError:
+    get_redis_client = None
+
+try:
+    from tradingagents.default_config import DEFAULT_CONFIG
+    DEFAULT_CONFIG_ERROR = None
+except Exception as e:
+    DEFAULT_CONFIG = None
+    DEFAULT_CONFIG_ERROR = str(e)
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# 迁移统计中表示实际迁移数量的字段，全部为0说明本次迁移没有写入任何数据
+MIGRATED_COUNT_FIELDS = (
+    'users_migrated', 'analyses_migrated', 'configs_migrated', 'activities_migrated',
+    'results_migrated', 'cache_entries_migrated', 'reports_migrated'
+)
+
+# 迁移互斥锁与后台迁移状态文件
+MIGRATION_LOCK_FILE = project_root / "migration.lock"
+MIGRATION_STATUS_FILE = project_root / "migration_status.json"
+
+
+async def _after(task: asyncio.Task, func: Callable[[], Awaitable[Any]],
+                 skip: Optional[Callable[[asyncio.Task], bool]] = None) -> Any:
+    """等待 task 结束（无论成功与否）后执行 func，返回其结果；skip(task) 为真时不执行，返回None"""
+    await asyncio.wait([task])
+    if skip is not None and skip(task):
+        return None
+    return await func()
+
+
+def _migrated_nothing(task: asyncio.Task) -> bool:
+    """迁移任务正常结束、没有错误且没有迁移任何数据"""
+    if task.cancelled() or task.exception() is not None:
+        return False
+    stats = task.result()
+    return not stats.errors and sum(getattr(stats, f, 0) for f in MIGRATED_COUNT_FIELDS) == 0
+
+
+def _acquire_migration_lock() -> Optional[IO[str]]:
+    """非阻塞获取迁移文件锁，锁已被其他迁移进程持有时返回None
+    
+    返回的文件对象在关闭前一直持有锁；不支持 fcntl 的平台上不加锁。
+    """
+    lock_file = open(MIGRATION_LOCK_FILE, 'w')
+    if FCNTL_AVAILABLE:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+
+def _write_status_file(status: Dict[str, Any]) -> None:
+    """原子地写入迁移状态文件，读取方不会看到写了一半的内容"""
+    tmp_file = MIGRATION_STATUS_FILE.with_suffix('.json.tmp')
+    tmp_file.write_text(json.dumps(status, ensure_ascii=False, default=str), encoding='utf-8')
+    os.replace(tmp_file, MIGRATION_STATUS_FILE)
+
+
+def _append_log(path: Path, text: str) -> None:
+    """以追加方式写入一次运行的日志，整段写入后只做一次 fsync"""
+    with open(path, 'ab', buffering=1 << 16) as f:
+        f.write(text.encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
 
 
 class MigrationRunner:
     """迁移运行器"""
     
-    def __init__(self):
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, track_status: bool = False):
         self.logger = logging.getLogger(__name__)
+        self.batch_size = batch_size
+        # track_status 为 True 时将运行状态写入 migration_status.json，供 --type status 查询
+        self.track_status = track_status
+        self.status: Dict[str, Any] = {}
+        # 所有迁移器共享同一个Motor客户端（连接池），避免各自重复握手和拓扑发现
+        self._mongo = AsyncIOMotorClient(
+            settings.MONGODB_URL,
+            maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+            minPoolSize=10
+        )
+        # 整个运行期间共享的数据库/Redis句柄，由 startup() 获取，前置条件检查和迁移器共用
+        self._db = None
+        self._redis = None
         self.migration_log_file = project_root / "migration_log.txt"
         
-    async def run_full_migration(self, skip_existing: bool = True) -> Dict[str, Any]:
-        """运行完整的数据迁移"""
+    async def run_full_migration(self, skip_existing: bool = True,
+                                 force_validate: bool = False) -> Dict[str, Any]:
+        """运行完整的数据迁移
+        
+        skip_existing 时，没有迁移任何新数据的迁移器跳过验证（重复运行的常见情况）；
+        force_validate 为 True 时总是验证。
+        """
         self.logger.info("开始完整数据迁移...")
         
+        # 耗时使用单调时钟计算，不受系统时间调整影响；结束时间由开始时间加耗时得到
+        t0 = time.monotonic_ns()
         migration_results = {
             'start_time': datetime.utcnow(),
             'streamlit_migration': None,
             'results_migration': None,
             'validation_results': None,
             'end_time': None,
+            'duration_ms': None,
             'success': False,
             'errors': []
         }
+        completed = False
         
         try:
-            # 1. 迁移Streamlit用户数据
-            self.logger.info("=== 第1步: 迁移Streamlit用户数据 ===")
-            streamlit_migrator = StreamlitDataMigrator()
-            streamlit_stats = await streamlit_migrator.migrate_all_data()
-            migration_results['streamlit_migration'] = {
-                'users_migrated': streamlit_stats.users_migrated,
-                'analyses_migrated': streamlit_stats.analyses_migrated,
-                'configs_migrated': streamlit_stats.configs_migrated,
-                'errors': streamlit_stats.errors
-            }
+            await self.startup()
+            streamlit_migrator = StreamlitDataMigrator(batch_size=self.batch_size, client=self._mongo)
+            results_migrator = AnalysisResultsMigrator(
+                batch_size=self.batch_size, client=self._mongo, redis_client=self._redis
+            )
             
-            # 2. 迁移分析结果数据
-            self.logger.info("=== 第2步: 迁移分析结果数据 ===")
-            results_migrator = AnalysisResultsMigrator()
-            results_stats = await results_migrator.migrate_all_results()
-            migration_results['results_migration'] = {
-                'results_migrated': results_stats.results_migrated,
-                'cache_entries_migrated': results_stats.cache_entries_migrated,
-                'reports_migrated': results_stats.reports_migrated,
-                'errors': results_stats.errors
-            }
+            # 1+2+3. 并发迁移Streamlit用户数据和分析结果数据，并在各自迁移完成后立即验证
+            # 分析结果文件会更新Streamlit迁移创建的分析记录，结果迁移器仅在该步骤等待Streamlit迁移完成；
+            # Streamlit数据验证与仍在进行的分析结果迁移重叠执行
+            self.logger.info("=== 第1/2/3步: 并发迁移Streamlit用户数据和分析结果数据，并验证迁移结果 ===")
+            skip_idle = _migrated_nothing if skip_existing and not force_validate else None
+            streamlit_task = asyncio.create_task(streamlit_migrator.migrate_all_data())
+            results_task = asyncio.create_task(
+                results_migrator.migrate_all_results(depends_on=streamlit_task)
+            )
+            steps = [
+                streamlit_task,
+                results_task,
+                asyncio.create_task(_after(streamlit_task, streamlit_migrator.validate_migration, skip_idle)),
+                asyncio.create_task(_after(results_task, results_migrator.validate_migration, skip_idle))
+            ]
             
-            # 3. 验证迁移结果
-            self.logger.info("=== 第3步: 验证迁移结果 ===")
-            streamlit_validation = await streamlit_migrator.validate_migration()
-            results_validation = await results_migrator.validate_migration()
+            # 每完成一步更新一次状态文件中的进度
+            done_steps = 0
             
-            migration_results['validation_results'] = {
-                'streamlit_validation': streamlit_validation,
-                'results_validation': results_validation
-            }
+            def _on_step_done(_task: asyncio.Task) -> None:
+                nonlocal done_steps
+                done_steps += 1
+                self.update_status(pct=done_steps * 100 // len(steps))
             
-            # 检查是否有严重错误
-            total_errors = (
-                len(streamlit_stats.errors) + 
-                len(results_stats.errors) +
-                len(streamlit_validation.get('validation_errors', [])) +
-                len(results_validation.get('validation_errors', []))
+            for step in steps:
+                step.add_done_callback(_on_step_done)
+            
+            streamlit_stats, results_stats, streamlit_validation, results_validation = await asyncio.gather(
+                *steps, return_exceptions=True
             )
             
-            migration_results['success'] = total_errors == 0
-            migration_results['end_time'] = datetime.utcnow()
+            total_errors = 0
+            if isinstance(streamlit_stats, Exception):
+                migration_results['errors'].append(f"Streamlit数据迁移失败: {streamlit_stats}")
+                total_errors += 1
+            else:
+                migration_results['streamlit_migration'] = streamlit_stats
+                total_errors += len(streamlit_stats.errors)
             
-            # 记录迁移日志
-            await self._write_migration_log(migration_results)
+            if isinstance(results_stats, Exception):
+                migration_results['errors'].append(f"分析结果迁移失败: {results_stats}")
+                total_errors += 1
+            else:
+                migration_results['results_migration'] = results_stats
+                total_errors += len(results_stats.errors)
+            
+            validation_results = {}
+            for key, validation in (('streamlit_validation', streamlit_validation),
+                                    ('results_validation', results_validation)):
+                if isinstance(validation, Exception):
+                    migration_results['errors'].append(f"{key} 执行失败: {validation}")
+                    total_errors += 1
+                elif validation is None:
+                    validation_results.setdefault('skipped', []).append(key)
+                    self.logger.info(f"未迁移任何新数据，跳过 {key}")
+                else:
+                    validation_results[key] = validation
+                    total_errors += len(validation.get('validation_errors', []))
             
-            self.logger.info(f"数据迁移完成，成功: {migration_results['success']}")
+            migration_results['validation_results'] = validation_results
+            
+            migration_results['success'] = total_errors == 0
+            completed = True
             
         except Exception as e:
             error_msg = f"数据迁移失败: {str(e)}"
             self.logger.error(error_msg)
             migration_results['errors'].append(error_msg)
             migration_results['success'] = False
-            migration_results['end_time'] = datetime.utcnow()
+        
+        finally:
+            duration_ms = (time.monotonic_ns() - t0) // 1_000_000
+            migration_results['duration_ms'] = duration_ms
+            migration_results['end_time'] = migration_results['start_time'] + timedelta(milliseconds=duration_ms)
+        
+        if completed:
+            # 记录迁移日志
+            await self._write_migration_log(migration_results)
+            
+            self.logger.info(f"数据迁移完成，成功: {migration_results['success']}，耗时: {migration_results['duration_ms']} ms")
         
         return migration_results
     
+    def update_status(self, **fields: Any) -> None:
+        """合并字段并写入迁移状态文件（未启用 track_status 时不做任何事）"""
+        if not self.track_status:
+            return
+        
+        self.status.update(fields)
+        self.status['updated_at'] = datetime.utcnow().isoformat()
+        try:
+            _write_status_file(self.status)
+        except OSError as e:
+            self.logger.warning(f"写入迁移状态文件失败: {e}")
+    
+    async def startup(self) -> None:
+        """获取共享的数据库和Redis句柄，已持有时直接复用
+        
+        获取Redis客户端失败时只记录日志，由前置条件检查报告该问题。
+        """
+        if self._db is None:
+            self._db = self._mongo[settings.MONGODB_DB_NAME]
+        if self._redis is None and get_redis_client is not None:
+            try:
+                self._redis = await get_redis_client()
+            except Exception as e:
+                self.logger.error(f"获取Redis客户端失败: {e}")
+    
+    async def aclose(self) -> None:
+        """关闭共享的数据库客户端和Redis客户端"""
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+        self._db = None
+        self._mongo.close()
+    
     async def run_partial_migration(self, migration_type: str) -> Dict[str, Any]:
         """运行部分迁移"""
         self.logger.info(f"开始部分迁移: {migration_type}")
         
+        await self.startup()
+        
         if migration_type == "streamlit":
-            migrator = StreamlitDataMigrator()
+            migrator = StreamlitDataMigrator(batch_size=self.batch_size, client=self._mongo)
             stats = await migrator.migrate_all_data()
             validation = await migrator.validate_migration()
             
@@ -117,7 +289,9 @@ class MigrationRunner:
             }
             
         elif migration_type == "results":
-            migrator = AnalysisResultsMigrator()
+            migrator = AnalysisResultsMigrator(
+                batch_size=self.batch_size, client=self._mongo, redis_client=self._redis
+            )
             stats = await migrator.migrate_all_results()
             validation = await migrator.validate_migration()
             
@@ -134,73 +308,80 @@ class MigrationRunner:
     async def _write_migration_log(self, migration_results: Dict[str, Any]) -> None:
         """写入迁移日志"""
         try:
-            log_content = []
-            log_content.append(f"=== 数据迁移日志 ===")
-            log_content.append(f"开始时间: {migration_results['start_time']}")
-            log_content.append(f"结束时间: {migration_results['end_time']}")
-            log_content.append(f"迁移成功: {migration_results['success']}")
-            log_content.append("")
+            buf = io.StringIO()
+            w = buf.write
+            # 每次运行以分隔线和运行头开始，便于在追加写入的日志中区分和比较各次运行
+            w(f"{'=' * 60}\n")
+            w(f"=== 数据迁移日志 (PID: {os.getpid()}) ===\n")
+            w(f"开始时间: {migration_results['start_time']}\n")
+            w(f"结束时间: {migration_results['end_time']}\n")
+            w(f"耗时: {migration_results['duration_ms']} ms\n")
+            w(f"迁移成功: {migration_results['success']}\n")
+            w("\n")
+            
+            sm = migration_results['streamlit_migration']
+            rm = migration_results['results_migration']
+            vr = migration_results['validation_results']
             
             # Streamlit迁移结果
-            if migration_results['streamlit_migration']:
-                sm = migration_results['streamlit_migration']
-                log_content.append("=== Streamlit数据迁移 ===")
-                log_content.append(f"用户迁移: {sm['users_migrated']}")
-                log_content.append(f"分析记录迁移: {sm['analyses_migrated']}")
-                log_content.append(f"配置迁移: {sm['configs_migrated']}")
-                log_content.append(f"错误数量: {len(sm['errors'])}")
-                if sm['errors']:
-                    log_content.append("错误详情:")
-                    for error in sm['errors']:
-                        log_content.append(f"  - {error}")
-                log_content.append("")
+            if sm is not None:
+                w("=== Streamlit数据迁移 ===\n")
+                w(f"用户迁移: {sm.users_migrated}\n")
+                w(f"分析记录迁移: {sm.analyses_migrated}\n")
+                w(f"配置迁移: {sm.configs_migrated}\n")
+                errs = sm.errors
+                w(f"错误数量: {len(errs)}\n")
+                if errs:
+                    w("错误详情:\n")
+                    w("".join(f"  - {error}\n" for error in errs))
+                w("\n")
             
             # 分析结果迁移结果
-            if migration_results['results_migration']:
-                rm = migration_results['results_migration']
-                log_content.append("=== 分析结果迁移 ===")
-                log_content.append(f"结果文件迁移: {rm['results_migrated']}")
-                log_content.append(f"缓存条目迁移: {rm['cache_entries_migrated']}")
-                log_content.append(f"报告文件迁移: {rm['reports_migrated']}")
-                log_content.append(f"错误数量: {len(rm['errors'])}")
-                if rm['errors']:
-                    log_content.append("错误详情:")
-                    for error in rm['errors']:
-                        log_content.append(f"  - {error}")
-                log_content.append("")
+            if rm is not None:
+                w("=== 分析结果迁移 ===\n")
+                w(f"结果文件迁移: {rm.results_migrated}\n")
+                w(f"缓存条目迁移: {rm.cache_entries_migrated}\n")
+                w(f"报告文件迁移: {rm.reports_migrated}\n")
+                errs = rm.errors
+                w(f"错误数量: {len(errs)}\n")
+                if errs:
+                    w("错误详情:\n")
+                    w("".join(f"  - {error}\n" for error in errs))
+                w("\n")
             
             # 验证结果
-            if migration_results['validation_results']:
-                vr = migration_results['validation_results']
-                log_content.append("=== 验证结果 ===")
+            if vr:
+                w("=== 验证结果 ===\n")
+                
+                if 'skipped' in vr:
+                    w(f"跳过验证（未迁移任何新数据）: {', '.join(vr['skipped'])}\n")
                 
                 if 'streamlit_validation' in vr:
                     sv = vr['streamlit_validation']
-                    log_content.append("Streamlit数据验证:")
-                    log_content.append(f"  用户总数: {sv['users_count']}")
-                    log_content.append(f"  分析记录总数: {sv['analyses_count']}")
-                    log_content.append(f"  配置总数: {sv['configs_count']}")
-                    if sv['validation_errors']:
-                        log_content.append("  验证错误:")
-                        for error in sv['validation_errors']:
-                            log_content.append(f"    - {error}")
+                    w("Streamlit数据验证:\n")
+                    w(f"  用户总数: {sv['users_count']}\n")
+                    w(f"  分析记录总数: {sv['analyses_count']}\n")
+                    w(f"  配置总数: {sv['configs_count']}\n")
+                    errs = sv['validation_errors']
+                    if errs:
+                        w("  验证错误:\n")
+                        w("".join(f"    - {error}\n" for error in errs))
                 
                 if 'results_validation' in vr:
                     rv = vr['results_validation']
-                    log_content.append("分析结果验证:")
-                    log_content.append(f"  包含结果的分析: {rv['analyses_with_results']}")
-                    log_content.append(f"  缓存条目: {rv['cache_entries']}")
-                    log_content.append(f"  报告数量: {rv['reports_count']}")
-                    if rv['validation_errors']:
-                        log_content.append("  验证错误:")
-                        for error in rv['validation_errors']:
-                            log_content.append(f"    - {error}")
+                    w("分析结果验证:\n")
+                    w(f"  包含结果的分析: {rv['analyses_with_results']}\n")
+                    w(f"  缓存条目: {rv['cache_entries']}\n")
+                    w(f"  报告数量: {rv['reports_count']}\n")
+                    errs = rv['validation_errors']
+                    if errs:
+                        w("  验证错误:\n")
+                        w("".join(f"    - {error}\n" for error in errs))
             
-            # 写入日志文件
-            with open(self.migration_log_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(log_content))
+            # 在线程中追加写入日志文件，避免阻塞事件循环；保留历次运行的记录
+            await asyncio.to_thread(_append_log, self.migration_log_file, buf.getvalue())
             
-            self.logger.info(f"迁移日志已写入: {self.migration_log_file}")
+            self.logger.info(f"迁移日志已追加写入: {self.migration_log_file}")
             
         except Exception as e:
             self.logger.error(f"写入迁移日志失败: {e}")
@@ -208,64 +389,80 @@ class MigrationRunner:
     async def check_migration_prerequisites(self) -> Dict[str, bool]:
         """检查迁移前置条件"""
         self.logger.info("检查迁移前置条件...")
+        await self.startup()
         
-        prerequisites = {
-            'database_connection': False,
-            'redis_connection': False,
-            'web_data_exists': False,
-            'analysis_data_exists': False,
-            'config_accessible': False
+        checks = {
+            'database_connection': self._check_database_connection,
+            'redis_connection': self._check_redis_connection,
+            'web_data_exists': self._check_web_data_exists,
+            'analysis_data_exists': self._check_analysis_data_exists,
+            'config_accessible': self._check_config_accessible
         }
         
-        try:
-            # 检查数据库连接
-            try:
-                from backend.core.database import get_database
-                db = await get_database()
-                await db.command('ping')
-                prerequisites['database_connection'] = True
-                self.logger.info("✓ 数据库连接正常")
-            except Exception as e:
-                self.logger.error(f"✗ 数据库连接失败: {e}")
-            
-            # 检查Redis连接
-            try:
-                from backend.core.redis_client import get_redis_client
-                redis_client = await get_redis_client()
-                await redis_client.ping()
-                prerequisites['redis_connection'] = True
-                self.logger.info("✓ Redis连接正常")
-            except Exception as e:
-                self.logger.error(f"✗ Redis连接失败: {e}")
-            
-            # 检查Web数据目录
-            web_data_dir = project_root / "web" / "data"
-            if web_data_dir.exists():
-                prerequisites['web_data_exists'] = True
-                self.logger.info(f"✓ Web数据目录存在: {web_data_dir}")
-            else:
-                self.logger.warning(f"✗ Web数据目录不存在: {web_data_dir}")
-            
-            # 检查分析数据目录
-            analysis_data_dir = project_root / "data"
-            if analysis_data_dir.exists():
-                prerequisites['analysis_data_exists'] = True
-                self.logger.info(f"✓ 分析数据目录存在: {analysis_data_dir}")
-            else:
-                self.logger.warning(f"✗ 分析数据目录不存在: {analysis_data_dir}")
-            
-            # 检查配置文件
-            try:
-                from tradingagents.default_config import DEFAULT_CONFIG
-                prerequisites['config_accessible'] = True
-                self.logger.info("✓ 配置文件可访问")
-            except Exception as e:
-                self.logger.error(f"✗ 配置文件访问失败: {e}")
-            
-        except Exception as e:
-            self.logger.error(f"前置条件检查失败: {e}")
+        # 各项检查并发运行，总耗时取决于最慢的一项（通常是数据库/Redis往返）
+        outcomes = await asyncio.gather(
+            *(check() for check in checks.values()),
+            return_exceptions=True
+        )
+        
+        prerequisites = {}
+        for name, outcome in zip(checks, outcomes):
+            if isinstance(outcome, Exception):
+                self.logger.error(f"前置条件检查失败 {name}: {outcome}")
+                outcome = False
+            prerequisites[name] = outcome
         
         return prerequisites
+    
+    async def _check_database_connection(self) -> bool:
+        """检查数据库连接"""
+        try:
+            await self._db.command('ping')
+            self.logger.info("✓ 数据库连接正常")
+            return True
+        except Exception as e:
+            self.logger.error(f"✗ 数据库连接失败: {e}")
+            return False
+    
+    async def _check_redis_connection(self) -> bool:
+        """检查Redis连接"""
+        if self._redis is None:
+            self.logger.error("✗ Redis客户端不可用")
+            return False
+        try:
+            await self._redis.ping()
+            self.logger.info("✓ Redis连接正常")
+            return True
+        except Exception as e:
+            self.logger.error(f"✗ Redis连接失败: {e}")
+            return False
+    
+    async def _check_web_data_exists(self) -> bool:
+        """检查Web数据目录"""
+        web_data_dir = project_root / "web" / "data"
+        # stat() 是阻塞的系统调用，放到线程中执行以便与网络检查并发
+        if await asyncio.to_thread(web_data_dir.exists):
+            self.logger.info(f"✓ Web数据目录存在: {web_data_dir}")
+            return True
+        self.logger.warning(f"✗ Web数据目录不存在: {web_data_dir}")
+        return False
+    
+    async def _check_analysis_data_exists(self) -> bool:
+        """检查分析数据目录"""
+        analysis_data_dir = project_root / "data"
+        if await asyncio.to_thread(analysis_data_dir.exists):
+            self.logger.info(f"✓ 分析数据目录存在: {analysis_data_dir}")
+            return True
+        self.logger.warning(f"✗ 分析数据目录不存在: {analysis_data_dir}")
+        return False
+    
+    async def _check_config_accessible(self) -> bool:
+        """检查配置文件"""
+        if DEFAULT_CONFIG_ERROR is None:
+            self.logger.info("✓ 配置文件可访问")
+            return True
+        self.logger.error(f"✗ 配置文件访问失败: {DEFAULT_CONFIG_ERROR}")
+        return False
 
 
 def setup_logging(log_level: str = "INFO"):
@@ -285,9 +482,15 @@ async def main():
     parser = argparse.ArgumentParser(description="TradingAgents数据迁移工具")
     parser.add_argument(
         "--type", 
-        choices=["full", "streamlit", "results", "check"], 
+        choices=["full", "streamlit", "results", "check", "status"], 
         default="full",
-        help="迁移类型"
+        help="迁移类型（status 查看后台迁移状态）"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["sync", "async", "skip"],
+        default="sync",
+        help="运行模式: sync 前台执行; async 在后台进程中执行并立即返回; skip 跳过迁移"
     )
     parser.add_argument(
         "--log-level", 
@@ -300,80 +503,192 @@ async def main():
         action="store_true",
         help="跳过已存在的数据"
     )
+    parser.add_argument(
+        "--force-validate",
+        action="store_true",
+        help="即使没有迁移任何新数据也执行验证"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="批量写入MongoDB的操作数"
+    )
+    # 内部参数：后台模式的父进程已持有迁移锁，把锁文件描述符传给子进程
+    parser.add_argument("--lock-fd", type=int, help=argparse.SUPPRESS)
     
     args = parser.parse_args()
     
-    # 设置日志
-    setup_logging(args.log_level)
+    if args.type == "status":
+        # 查看后台迁移状态
+        if not MIGRATION_STATUS_FILE.exists():
+            print("没有迁移状态记录")
+            return
+        status = json.loads(MIGRATION_STATUS_FILE.read_text(encoding='utf-8'))
+        print("\n=== 迁移状态 ===")
+        for key, value in status.items():
+            print(f"{key}: {value}")
+        return
     
-    runner = MigrationRunner()
+    migrating = args.type != "check"
     
-    if args.type == "check":
-        # 检查前置条件
-        prerequisites = await runner.check_migration_prerequisites()
-        
-        print("\n=== 迁移前置条件检查 ===")
-        for condition, status in prerequisites.items():
-            status_symbol = "✓" if status else "✗"
-            print(f"{status_symbol} {condition}: {'通过' if status else '失败'}")
-        
-        all_passed = all(prerequisites.values())
-        print(f"\n前置条件检查: {'全部通过' if all_passed else '存在问题'}")
-        
-        if not all_passed:
-            print("请解决上述问题后再运行迁移")
-            sys.exit(1)
+    if migrating and args.mode == "skip":
+        print("已跳过迁移 (--mode skip)")
+        return
     
-    elif args.type == "full":
-        # 完整迁移
-        results = await runner.run_full_migration(args.skip_existing)
-        
-        print("\n=== 完整迁移结果 ===")
-        print(f"迁移成功: {results['success']}")
-        print(f"开始时间: {results['start_time']}")
-        print(f"结束时间: {results['end_time']}")
+    if migrating and args.mode == "async":
+        # 后台模式: 以 sync 模式启动独立进程执行迁移，当前进程立即返回
+        lock_file = _acquire_migration_lock()
+        if lock_file is None:
+            print("已有迁移正在运行，使用 --type status 查看进度")
+            sys.exit(1)
         
-        if results['streamlit_migration']:
-            sm = results['streamlit_migration']
-            print(f"\nStreamlit数据迁移:")
-            print(f"  用户: {sm['users_migrated']}")
-            print(f"  分析记录: {sm['analyses_migrated']}")
-            print(f"  配置: {sm['configs_migrated']}")
-            print(f"  错误: {len(sm['errors'])}")
+        command = [
+            sys.executable, str(Path(__file__).resolve()),
+            "--type", args.type,
+            "--mode", "sync",
+            "--log-level", args.log_level,
+            "--batch-size", str(args.batch_size)
+        ]
+        if args.skip_existing:
+            command.append("--skip-existing")
+        if args.force_validate:
+            command.append("--force-validate")
         
-        if results['results_migration']:
-            rm = results['results_migration']
-            print(f"\n分析结果迁移:")
-            print(f"  结果文件: {rm['results_migrated']}")
-            print(f"  缓存条目: {rm['cache_entries_migrated']}")
-            print(f"  报告文件: {rm['reports_migrated']}")
-            print(f"  错误: {len(rm['errors'])}")
+        # flock 锁属于打开的文件，子进程继承锁文件描述符后锁一直由子进程持有，
+        # 父进程关闭自己的副本时不会释放锁，其他迁移无法在两者之间抢到锁
+        pass_fds = ()
+        if FCNTL_AVAILABLE:
+            command += ["--lock-fd", str(lock_file.fileno())]
+            pass_fds = (lock_file.fileno(),)
         
-        if not results['success']:
-            print(f"\n迁移过程中发现错误，详细信息请查看日志文件")
+        try:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+                pass_fds=pass_fds
+            )
+        finally:
+            lock_file.close()
+        print(f"迁移已在后台启动 (PID: {process.pid})，使用 --type status 查看进度")
+        return
+    
+    # 设置日志
+    setup_logging(args.log_level)
+    
+    lock_file = None
+    if migrating and args.lock_fd is not None:
+        # 由后台模式启动：锁已由父进程获取并随文件描述符传入
+        lock_file = os.fdopen(args.lock_fd, 'w')
+    elif migrating:
+        lock_file = _acquire_migration_lock()
+        if lock_file is None:
+            print("已有迁移正在运行，使用 --type status 查看进度")
             sys.exit(1)
     
-    else:
-        # 部分迁移
-        results = await runner.run_partial_migration(args.type)
-        
-        print(f"\n=== {results['type']} 迁移结果 ===")
-        print(f"迁移成功: {results['success']}")
-        
-        if hasattr(results['stats'], 'users_migrated'):
-            print(f"用户迁移: {results['stats'].users_migrated}")
-            print(f"分析记录迁移: {results['stats'].analyses_migrated}")
-            print(f"配置迁移: {results['stats'].configs_migrated}")
-        
-        if hasattr(results['stats'], 'results_migrated'):
-            print(f"结果文件迁移: {results['stats'].results_migrated}")
-            print(f"缓存条目迁移: {results['stats'].cache_entries_migrated}")
-            print(f"报告文件迁移: {results['stats'].reports_migrated}")
+    runner = MigrationRunner(batch_size=args.batch_size, track_status=migrating)
+    runner.update_status(
+        state='running',
+        type=args.type,
+        pid=os.getpid(),
+        pct=0,
+        started_at=datetime.utcnow().isoformat()
+    )
+    
+    try:
+        if args.type == "check":
+            # 检查前置条件
+            prerequisites = await runner.check_migration_prerequisites()
+            
+            print("\n=== 迁移前置条件检查 ===")
+            all_passed = True
+            for condition, status in prerequisites.items():
+                if not status:
+                    all_passed = False
+                status_symbol = "✓" if status else "✗"
+                print(f"{status_symbol} {condition}: {'通过' if status else '失败'}")
+            
+            print(f"\n前置条件检查: {'全部通过' if all_passed else '存在问题'}")
+            
+            if not all_passed:
+                print("请解决上述问题后再运行迁移")
+                sys.exit(1)
         
-        print(f"错误数量: {len(results['stats'].errors)}")
+        elif args.type == "full":
+            # 完整迁移
+            results = await runner.run_full_migration(args.skip_existing, args.force_validate)
+            
+            print("\n=== 完整迁移结果 ===")
+            print(f"迁移成功: {results['success']}")
+            print(f"开始时间: {results['start_time']}")
+            print(f"结束时间: {results['end_time']}")
+            print(f"耗时: {results['duration_ms']} ms")
+            
+            if results['streamlit_migration'] is not None:
+                sm = results['streamlit_migration']
+                print(f"\nStreamlit数据迁移:")
+                print(f"  用户: {sm.users_migrated}")
+                print(f"  分析记录: {sm.analyses_migrated}")
+                print(f"  配置: {sm.configs_migrated}")
+                print(f"  错误: {len(sm.errors)}")
+            
+            if results['results_migration'] is not None:
+                rm = results['results_migration']
+                print(f"\n分析结果迁移:")
+                print(f"  结果文件: {rm.results_migrated}")
+                print(f"  缓存条目: {rm.cache_entries_migrated}")
+                print(f"  报告文件: {rm.reports_migrated}")
+                print(f"  错误: {len(rm.errors)}")
+            
+            runner.update_status(
+                state='completed' if results['success'] else 'failed',
+                pct=100,
+                success=results['success'],
+                duration_ms=results['duration_ms']
+            )
+            
+            if not results['success']:
+                print(f"\n迁移过程中发现错误，详细信息请查看日志文件")
+                sys.exit(1)
         
-        if not results['success']:
-            sys.exit(1)
+        else:
+            # 部分迁移
+            results = await runner.run_partial_migration(args.type)
+            
+            print(f"\n=== {results['type']} 迁移结果 ===")
+            print(f"迁移成功: {results['success']}")
+            
+            if hasattr(results['stats'], 'users_migrated'):
+                print(f"用户迁移: {results['stats'].users_migrated}")
+                print(f"分析记录迁移: {results['stats'].analyses_migrated}")
+                print(f"配置迁移: {results['stats'].configs_migrated}")
+            
+            if hasattr(results['stats'], 'results_migrated'):
+                print(f"结果文件迁移: {results['stats'].results_migrated}")
+                print(f"缓存条目迁移: {results['stats'].cache_entries_migrated}")
+                print(f"报告文件迁移: {results['stats'].reports_migrated}")
+            
+            print(f"错误数量: {len(results['stats'].errors)}")
+            
+            runner.update_status(
+                state='completed' if results['success'] else 'failed',
+                pct=100,
+                success=results['success']
+            )
+            
+            if not results['success']:
+                sys.exit(1)
+    
+    finally:
+        # 异常退出时也不能让状态文件停留在 running
+        if runner.status.get('state') == 'running':
+            runner.update_status(state='failed', success=False)
+        await runner.aclose()
+        if lock_file is not None:
+            lock_file.close()
     
     print("\n迁移完成！")
 
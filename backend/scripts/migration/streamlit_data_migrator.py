@@ -5,14 +5,21 @@ Streamlit用户数据迁移脚本
 """
 
 import os
+import re
 import sys
 import json
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+import orjson
+from bson import ObjectId
+from pymongo import UpdateOne, WriteConcern
+from pymongo.errors import OperationFailure
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent.parent.parent
@@ -21,30 +28,133 @@ sys.path.insert(0, str(project_root))
 from backend.models.user import UserInDB, UserRole
 from backend.models.analysis import AnalysisInDB, AnalysisStatus, MarketType
 from backend.models.config import ConfigInDB, ConfigType
+from backend.app.config import settings
 from backend.core.database import get_database
 from backend.utils.security import get_password_hash
 
+from bulk import AsyncBulkWriter, DEFAULT_BATCH_SIZE
+
+# 批量迁移写入使用的写关注：主节点确认即可，不等待journal落盘。
+# 不使用 w=0：未确认的写入拿不到插入/upsert数量，也无法报告单条写入错误
+MIGRATION_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# 与 UserBase.username 的长度约束一致
+USERNAME_MIN_LENGTH = 3
+USERNAME_MAX_LENGTH = 50
+
+# 港股代码: HK前缀或5位数字；美股代码: 1-5位字母。预编译后每条活动只做一次正则匹配
+_HK_CODE_RE = re.compile(r'HK|\d{5}\Z')
+_US_CODE_RE = re.compile(r'[A-Z]{1,5}\Z')
+
+# 逐条记录的日志降为DEBUG，每提交这么多条输出一次INFO进度汇总
+PROGRESS_LOG_INTERVAL = 1000
+
+# 活动迁移断点文件（位于 user_activities 目录下），记录已完整迁移的文件指纹
+ACTIVITY_CHECKPOINT_FILE = ".migration_checkpoint"
+
+# 活动迁移同时进行的批量写入数（需要唯一索引保证并发upsert不产生重复记录）
+ACTIVITY_WRITE_CONCURRENCY = 8
+# 活动upsert的匹配键，同时是分析记录唯一索引的键
+ACTIVITY_INDEX_KEYS = [("user_id", 1), ("stock_code", 1), ("created_at", 1)]
 
-@dataclass
+
+def _document_template(model) -> Dict[str, Any]:
+    """将校验过的模型转换为文档模板，去掉 _id 以便驱动/服务端为每个文档生成新的ID"""
+    template = model.dict(by_alias=True)
+    template.pop('_id', None)
+    return template
+
+
+def _list_activity_files(activities_dir: Path) -> List[Tuple[Path, List[int]]]:
+    """按文件名顺序列出活动文件及其指纹 [文件大小, 修改时间(ns)]
+    
+    活动文件名通常带有日期，按名称排序即按时间顺序处理；最新的文件可能仍在追加写入，
+    指纹会随之变化，因此断点按指纹而不是按文件名比较。
+    """
+    activity_files = []
+    for path in sorted(activities_dir.glob("user_activities_*.jsonl"), key=lambda p: p.name):
+        stat = path.stat()
+        activity_files.append((path, [stat.st_size, stat.st_mtime_ns]))
+    return activity_files
+
+
+def _parse_activity_file(path: str) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """解析单个用户活动文件，返回 (该文件中的用户信息, 需要迁移的股票分析活动)
+    
+    用户信息中的 first_seen / last_seen 为原始时间戳。活动只保留迁移需要的字段，
+    并以活动ID（没有时为 文件名:行号）引用原始记录，不保留完整的原始活动。
+    
+    在进程池中执行，因此定义在模块级别，参数和返回值都可以pickle。
+    """
+    users_data = {}
+    activities = []
+    
+    file_name = Path(path).name
+    
+    with open(path, 'rb') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                activity = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # orjson 不接受 NaN/Infinity 等标准库 json 能读取的值，这类行改用 json 解析
+                activity = json.loads(line)
+            username = activity.get('username', 'unknown')
+            
+            # 直接比较原始时间戳，datetime 在合并完所有文件后才创建
+            ts = activity['timestamp']
+            user_info = users_data.get(username)
+            if user_info is None:
+                users_data[username] = {'first_seen': ts, 'last_seen': ts, 'activity_count': 1}
+            else:
+                if ts < user_info['first_seen']:
+                    user_info['first_seen'] = ts
+                if ts > user_info['last_seen']:
+                    user_info['last_seen'] = ts
+                user_info['activity_count'] += 1
+            
+            # 只有股票分析相关、且带有股票代码的活动需要迁移为分析记录
+            action_name = activity.get('action_name', '').lower()
+            if 'analysis' not in action_name and 'stock' not in action_name:
+                continue
+            details = activity.get('details') or {}
+            stock_code = details.get('stock_code') or details.get('symbol', '')
+            if not stock_code:
+                continue
+            
+            activities.append({
+                'activity_id': activity.get('id') or f"{file_name}:{line_no}",
+                'username': username,
+                'timestamp': ts,
+                'success': activity.get('success', True),
+                'stock_code': str(stock_code),
+                'error': details.get('error')
+            })
+    
+    return users_data, activities
+
+
+@dataclass(slots=True)
 class MigrationStats:
     """迁移统计信息"""
     users_migrated: int = 0
     analyses_migrated: int = 0
     configs_migrated: int = 0
     activities_migrated: int = 0
-    errors: List[str] = None
-    
-    def __post_init__(self):
-        if self.errors is None:
-            self.errors = []
+    errors: List[str] = field(default_factory=list)
 
 
 class StreamlitDataMigrator:
     """Streamlit数据迁移器"""
     
-    def __init__(self, web_data_dir: Path = None):
+    def __init__(self, web_data_dir: Path = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 client=None):
         self.logger = logging.getLogger(__name__)
         self.web_data_dir = web_data_dir or project_root / "web" / "data"
+        self.batch_size = batch_size
+        # 传入 client 时使用调用方共享的Motor客户端，否则使用全局数据库连接
+        self.client = client
         self.stats = MigrationStats()
         
     async def migrate_all_data(self) -> MigrationStats:
@@ -53,19 +163,16 @@ class StreamlitDataMigrator:
         
         try:
             # 获取数据库连接
-            db = await get_database()
-            
-            # 1. 迁移用户数据
-            await self._migrate_users(db)
-            
-            # 2. 迁移用户活动记录为分析历史
-            await self._migrate_user_activities(db)
-            
-            # 3. 迁移配置数据
-            await self._migrate_configurations(db)
-            
-            # 4. 迁移缓存数据
-            await self._migrate_cache_data(db)
+            db = await self._get_database()
+            
+            # 1+2. 用户和活动记录（活动依赖用户ID，二者顺序执行）
+            # 3. 配置数据  4. 缓存数据：与前两步互不依赖，三条链并发执行
+            # 各步骤在事件循环的单线程中更新统计，两次 await 之间的计数更新不会交错，无需加锁
+            await asyncio.gather(
+                self._migrate_activity_data(db),
+                self._migrate_configurations(db),
+                self._migrate_cache_data(db)
+            )
             
             self.logger.info(f"数据迁移完成: {self.stats}")
             
@@ -75,177 +182,351 @@ class StreamlitDataMigrator:
             
         return self.stats
     
-    async def _migrate_users(self, db) -> None:
-        """迁移用户数据"""
+    async def _migrate_activity_data(self, db) -> None:
+        """迁移用户数据和用户活动记录"""
+        # 单次遍历活动日志，用户迁移和活动迁移共用解析结果
+        users_data, activities, scanned_files = await self._scan_activities()
+        errors_before = len(self.stats.errors)
+        
+        # 1. 迁移用户数据
+        await self._migrate_users(db, users_data)
+        
+        # 2. 迁移用户活动记录为分析历史
+        await self._migrate_user_activities(db, activities)
+        
+        # 全部写入成功后才记录断点，否则下次运行重新处理这些文件（写入是幂等的）
+        if scanned_files and len(self.stats.errors) == errors_before:
+            try:
+                await asyncio.to_thread(self._save_activity_checkpoint, scanned_files)
+            except OSError as e:
+                self.logger.warning(f"写入活动迁移断点失败: {e}")
+    
+    async def _get_database(self):
+        """获取数据库：优先使用共享客户端"""
+        if self.client is not None:
+            return self.client[settings.MONGODB_DB_NAME]
+        return await get_database()
+    
+    async def _migrate_users(self, db, users_data: Dict[str, Dict[str, Any]]) -> None:
+        """迁移从用户活动日志中提取的用户数据"""
         self.logger.info("开始迁移用户数据...")
         
         try:
-            # 从用户活动日志中提取用户信息
-            users_data = await self._extract_users_from_activities()
-            
             users_collection = db.users
+            # 用户名唯一索引（与 init_db 中的定义相同，已存在时为空操作）保证并发写入时不会产生重复用户
+            try:
+                await users_collection.create_index("username", unique=True)
+            except OperationFailure as e:
+                # 已有数据中存在重复用户名时无法创建唯一索引；用户按批顺序upsert并跳过已存在的用户名，迁移可以继续
+                self.logger.warning(f"创建用户名唯一索引失败，将不使用唯一约束: {e}")
+            # 一次性取出已存在的用户名，代替逐个用户的 find_one 查询，已存在的用户不再发送写操作
+            existing_usernames = set(await users_collection.distinct("username"))
+            users_writer = AsyncBulkWriter(
+                users_collection.with_options(write_concern=MIGRATION_WRITE_CONCERN), self.batch_size
+            )
+            # 默认密码是常量，哈希（刻意设计得很慢）只计算一次，所有迁移用户共用
+            default_password_hash = get_password_hash("changeme123")
+            # 用户文档模板只经过一次模型校验，每个用户复制模板后填入变化的字段
+            user_template = _document_template(UserInDB(
+                username="placeholder",
+                role=UserRole.USER,  # 默认为普通用户
+                password_hash=default_password_hash,  # 默认密码
+                is_active=True
+            ))
+            
+            existing_count = 0
+            queued_count = 0
             
             for username, user_info in users_data.items():
                 try:
                     # 检查用户是否已存在
-                    existing_user = await users_collection.find_one({"username": username})
-                    if existing_user:
-                        self.logger.info(f"用户 {username} 已存在，跳过")
+                    if username in existing_usernames:
+                        self.logger.debug(f"用户 {username} 已存在，跳过")
+                        existing_count += 1
                         continue
                     
+                    # 不再逐个构造模型，保留 UserBase 对用户名长度的约束
+                    if not USERNAME_MIN_LENGTH <= len(username) <= USERNAME_MAX_LENGTH:
+                        raise ValueError(
+                            f"用户名长度必须在 {USERNAME_MIN_LENGTH}-{USERNAME_MAX_LENGTH} 之间"
+                        )
+                    
                     # 创建新用户
-                    user_doc = UserInDB(
-                        username=username,
-                        email=user_info.get("email"),
-                        role=UserRole.USER,  # 默认为普通用户
-                        password_hash=get_password_hash("changeme123"),  # 默认密码
-                        created_at=user_info.get("first_seen", datetime.utcnow()),
-                        last_login=user_info.get("last_seen"),
-                        is_active=True
-                    )
+                    user_doc = {
+                        **user_template,
+                        'username': username,
+                        'email': user_info.get("email"),
+                        'permissions': [],
+                        'created_at': user_info["first_seen"],
+                        'last_login': user_info["last_seen"]
+                    }
                     
-                    result = await users_collection.insert_one(user_doc.dict(by_alias=True))
-                    self.logger.info(f"成功迁移用户: {username} (ID: {result.inserted_id})")
-                    self.stats.users_migrated += 1
+                    # 以用户名为键upsert：distinct 之后才由其他进程创建的同名用户不会被覆盖，也不会报重复键错误
+                    await users_writer.submit(UpdateOne(
+                        {'username': username},
+                        {'$setOnInsert': user_doc},
+                        upsert=True
+                    ))
+                    self.logger.debug(f"迁移用户: {username}")
+                    queued_count += 1
+                    if queued_count % PROGRESS_LOG_INTERVAL == 0:
+                        self.logger.info(f"已提交用户: {queued_count}")
                     
                 except Exception as e:
                     error_msg = f"迁移用户 {username} 失败: {str(e)}"
                     self.logger.error(error_msg)
                     self.stats.errors.append(error_msg)
+            
+            await users_writer.aclose()
+            self.stats.users_migrated += users_writer.upserted_count
+            self.logger.info(
+                f"用户迁移完成: 新增 {users_writer.upserted_count}，已存在跳过 {existing_count}"
+            )
+            self.stats.errors.extend(users_writer.errors)
                     
         except Exception as e:
             error_msg = f"用户数据迁移失败: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
     
-    async def _extract_users_from_activities(self) -> Dict[str, Dict[str, Any]]:
-        """从用户活动日志中提取用户信息"""
+    async def _scan_activities(self) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]],
+                                             Dict[str, List[int]]]:
+        """单次遍历用户活动日志
+        
+        返回 (用户信息, 需要迁移为分析记录的股票分析活动, 本次成功解析的文件指纹)，
+        每个文件只读取和解析一次；指纹与断点记录一致的文件（上次已完整迁移且未改变）直接跳过。
+        """
         users_data = {}
+        activities = []
+        scanned_files: Dict[str, List[int]] = {}
         activities_dir = self.web_data_dir / "user_activities"
         
-        if not activities_dir.exists():
+        # 文件系统操作都不在事件循环中执行：目录检查和列举在线程中，文件读取和解析在进程池/线程中
+        if not await asyncio.to_thread(activities_dir.exists):
             self.logger.warning(f"用户活动目录不存在: {activities_dir}")
-            return users_data
+            return users_data, activities, scanned_files
         
-        for activity_file in activities_dir.glob("user_activities_*.jsonl"):
-            try:
-                with open(activity_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if line.strip():
-                            activity = json.loads(line.strip())
-                            username = activity.get('username', 'unknown')
-                            
-                            if username not in users_data:
-                                users_data[username] = {
-                                    'first_seen': datetime.fromtimestamp(activity['timestamp']),
-                                    'last_seen': datetime.fromtimestamp(activity['timestamp']),
-                                    'activity_count': 0
-                                }
-                            
-                            # 更新用户信息
-                            user_info = users_data[username]
-                            activity_time = datetime.fromtimestamp(activity['timestamp'])
-                            
-                            if activity_time < user_info['first_seen']:
-                                user_info['first_seen'] = activity_time
-                            if activity_time > user_info['last_seen']:
-                                user_info['last_seen'] = activity_time
-                            
-                            user_info['activity_count'] += 1
-                            
-            except Exception as e:
-                self.logger.error(f"读取活动文件失败 {activity_file}: {e}")
+        listed_files, checkpoint = await asyncio.gather(
+            asyncio.to_thread(_list_activity_files, activities_dir),
+            asyncio.to_thread(self._load_activity_checkpoint)
+        )
+        activity_files = []
+        fingerprints = []
+        for activity_file, fingerprint in listed_files:
+            if checkpoint.get(activity_file.name) == fingerprint:
+                continue
+            activity_files.append(activity_file)
+            fingerprints.append(fingerprint)
+        
+        skipped = len(listed_files) - len(activity_files)
+        if skipped:
+            self.logger.info(f"跳过上次已迁移且未改变的活动文件 {skipped} 个")
+        if not activity_files:
+            return users_data, activities, scanned_files
         
-        return users_data
+        # 解析是CPU密集型的（JSON解码和时间转换），多个文件时分发到进程池绕开GIL；
+        # 只有一个文件时在线程中解析，省去启动进程池的开销
+        if len(activity_files) == 1:
+            results = await asyncio.gather(
+                asyncio.to_thread(_parse_activity_file, str(activity_files[0])),
+                return_exceptions=True
+            )
+        else:
+            loop = asyncio.get_running_loop()
+            max_workers = min(len(activity_files), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = await asyncio.gather(
+                    *(loop.run_in_executor(pool, _parse_activity_file, str(activity_file))
+                      for activity_file in activity_files),
+                    return_exceptions=True
+                )
+        
+        # 合并各文件的部分结果：first_seen 取最小，last_seen 取最大，活动次数相加
+        for activity_file, fingerprint, result in zip(activity_files, fingerprints, results):
+            if isinstance(result, Exception):
+                error_msg = f"处理活动文件失败 {activity_file}: {str(result)}"
+                self.logger.error(error_msg)
+                self.stats.errors.append(error_msg)
+                continue
+            
+            scanned_files[activity_file.name] = fingerprint
+            users_partial, file_activities = result
+            for username, partial in users_partial.items():
+                user_info = users_data.get(username)
+                if user_info is None:
+                    users_data[username] = partial
+                    continue
+                if partial['first_seen'] < user_info['first_seen']:
+                    user_info['first_seen'] = partial['first_seen']
+                if partial['last_seen'] > user_info['last_seen']:
+                    user_info['last_seen'] = partial['last_seen']
+                user_info['activity_count'] += partial['activity_count']
+            activities.extend(file_activities)
+        
+        # 合并完成后每个用户只转换一次时间戳
+        # 与已迁移的数据保持一致，使用本地时区的naive时间（created_at 是活动upsert的匹配键之一）
+        for user_info in users_data.values():
+            user_info['first_seen'] = datetime.fromtimestamp(user_info['first_seen'])
+            user_info['last_seen'] = datetime.fromtimestamp(user_info['last_seen'])
+        
+        return users_data, activities, scanned_files
+    
+    def _activity_checkpoint_path(self) -> Path:
+        return self.web_data_dir / "user_activities" / ACTIVITY_CHECKPOINT_FILE
+    
+    def _load_activity_checkpoint(self) -> Dict[str, List[int]]:
+        """读取活动迁移断点：文件名 -> [文件大小, 修改时间(ns)]"""
+        try:
+            return orjson.loads(self._activity_checkpoint_path().read_bytes())
+        except FileNotFoundError:
+            return {}
+        except (OSError, orjson.JSONDecodeError) as e:
+            self.logger.warning(f"读取活动迁移断点失败，将重新处理所有文件: {e}")
+            return {}
+    
+    def _save_activity_checkpoint(self, scanned_files: Dict[str, List[int]]) -> None:
+        """将本次完整迁移的文件指纹合并写入断点文件（先写临时文件再替换）"""
+        checkpoint = self._load_activity_checkpoint()
+        checkpoint.update(scanned_files)
+        path = self._activity_checkpoint_path()
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_bytes(orjson.dumps(checkpoint))
+        os.replace(tmp_path, path)
     
-    async def _migrate_user_activities(self, db) -> None:
+    async def _migrate_user_activities(self, db, activities: List[Dict[str, Any]]) -> None:
         """迁移用户活动记录为分析历史"""
         self.logger.info("开始迁移用户活动记录...")
         
         try:
-            activities_dir = self.web_data_dir / "user_activities"
-            if not activities_dir.exists():
-                self.logger.warning(f"用户活动目录不存在: {activities_dir}")
+            if not activities:
                 return
             
-            users_collection = db.users
-            analyses_collection = db.analyses
+            # 分析文档模板只经过一次模型校验，每条活动复制模板后填入变化的字段
+            analysis_template = _document_template(AnalysisInDB(
+                user_id=ObjectId(),
+                stock_code="placeholder",
+                market_type=MarketType.CN
+            ))
+            
+            # 一次性加载 用户名 -> 用户ID 映射，代替逐条活动的 find_one 查询；
+            # 只查询活动中出现的用户名（走用户名唯一索引），不遍历整个用户集合
+            usernames = list({activity['username'] for activity in activities})
+            user_ids = {
+                user['username']: user['_id']
+                async for user in db.users.find({'username': {'$in': usernames}}, {'username': 1})
+            }
+            # 找不到的用户汇总输出一次，不再逐条活动告警
+            missing_users = [username for username in usernames if username not in user_ids]
+            if missing_users:
+                self.logger.warning(
+                    f"未找到 {len(missing_users)} 个用户，其活动不迁移: {', '.join(missing_users[:10])}"
+                )
             
-            for activity_file in activities_dir.glob("user_activities_*.jsonl"):
-                try:
-                    with open(activity_file, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            if line.strip():
-                                activity = json.loads(line.strip())
-                                await self._process_activity_record(
-                                    activity, users_collection, analyses_collection
-                                )
-                                
-                except Exception as e:
-                    error_msg = f"处理活动文件失败 {activity_file}: {str(e)}"
-                    self.logger.error(error_msg)
-                    self.stats.errors.append(error_msg)
+            # 各upsert互不依赖（同键并发upsert由唯一索引和服务端重试保证只插入一次），多个批次并发写入；
+            # 没有唯一索引时并发的同键upsert可能各自插入，退回逐批顺序写入
+            has_unique_index = await self._ensure_activity_index(db.analyses)
+            analyses_writer = AsyncBulkWriter(
+                db.analyses.with_options(write_concern=MIGRATION_WRITE_CONCERN),
+                self.batch_size,
+                max_concurrency=ACTIVITY_WRITE_CONCURRENCY if has_unique_index else 1
+            )
+            
+            # 批次在写入器的后台任务中写入，生成后续操作与已提交批次的写入重叠执行
+            try:
+                queued_count = 0
+                for activity in activities:
+                    op = self._process_activity_record(activity, user_ids, analysis_template)
+                    if op is None:
+                        continue
+                    await analyses_writer.submit(op)
+                    queued_count += 1
+                    if queued_count % PROGRESS_LOG_INTERVAL == 0:
+                        self.logger.info(f"已提交活动记录: {queued_count}")
+            finally:
+                # 出错时也等待已提交的批次完成，不遗留未等待的写入任务
+                await analyses_writer.aclose()
+                self.stats.errors.extend(analyses_writer.errors)
+            
+            self.stats.analyses_migrated += analyses_writer.upserted_count
                     
         except Exception as e:
             error_msg = f"用户活动迁移失败: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
     
-    async def _process_activity_record(self, activity: Dict[str, Any], 
-                                     users_collection, analyses_collection) -> None:
-        """处理单个活动记录"""
+    async def _ensure_activity_index(self, analyses_collection) -> bool:
+        """创建 (用户, 股票代码, 创建时间) 唯一索引，返回集合上是否有该唯一索引
+        
+        活动记录以该组合为键批量upsert，索引使每个upsert的查找走索引而不是全表扫描，
+        并由服务端保证重复运行时不会产生重复的分析记录。
+        已有数据中存在重复键时无法创建唯一索引，此时记录警告并返回 False，调用方改为顺序写入。
+        """
         try:
-            # 只处理股票分析相关的活动
-            action_name = activity.get('action_name', '')
-            if 'analysis' not in action_name.lower() and 'stock' not in action_name.lower():
-                return
-            
-            username = activity.get('username', 'unknown')
+            await analyses_collection.create_index(
+                ACTIVITY_INDEX_KEYS,
+                unique=True,
+                name="user_stock_created_unique"
+            )
+            return True
+        except OperationFailure as e:
+            # 同样的唯一索引可能已以其他名称存在
+            index_info = await analyses_collection.index_information()
+            if any(index.get('unique') and index['key'] == ACTIVITY_INDEX_KEYS
+                   for index in index_info.values()):
+                return True
+            self.logger.warning(f"创建分析记录唯一索引失败，活动记录将顺序写入: {e}")
+            return False
+    
+    def _process_activity_record(self, activity: Dict[str, Any], user_ids: Dict[str, Any],
+                                 analysis_template: Dict[str, Any]) -> Optional[UpdateOne]:
+        """将解析出的活动记录转换为分析记录的upsert操作；找不到用户时返回None"""
+        try:
+            username = activity['username']
             
             # 查找用户ID
-            user = await users_collection.find_one({"username": username})
-            if not user:
-                self.logger.warning(f"未找到用户: {username}")
-                return
+            user_id = user_ids.get(username)
+            if user_id is None:
+                self.logger.debug(f"未找到用户: {username}")
+                return None
             
-            # 提取股票代码和分析参数
-            details = activity.get('details', {})
-            stock_code = details.get('stock_code') or details.get('symbol', '')
-            
-            if not stock_code:
-                return  # 没有股票代码的活动不迁移
+            stock_code = activity['stock_code']
+            success = activity['success']
+            # 本地时区的naive时间，与之前迁移写入的 created_at 一致，重复运行时upsert才能匹配到已有记录
+            activity_time = datetime.fromtimestamp(activity['timestamp'])
             
             # 创建分析记录
-            analysis_doc = AnalysisInDB(
-                user_id=user['_id'],
-                stock_code=stock_code,
-                market_type=self._detect_market_type(stock_code),
-                status=AnalysisStatus.COMPLETED if activity.get('success', True) else AnalysisStatus.FAILED,
-                progress=100.0 if activity.get('success', True) else 0.0,
-                config={
+            analysis_doc = {
+                **analysis_template,
+                'user_id': user_id,
+                'stock_code': stock_code,
+                'market_type': self._detect_market_type(stock_code),
+                'status': AnalysisStatus.COMPLETED if success else AnalysisStatus.FAILED,
+                'progress': 100.0 if success else 0.0,
+                'config': {
                     'migrated_from_streamlit': True,
-                    'original_activity': activity
+                    'activity_id': activity['activity_id']
                 },
-                created_at=datetime.fromtimestamp(activity['timestamp']),
-                completed_at=datetime.fromtimestamp(activity['timestamp']) if activity.get('success', True) else None,
-                error_message=details.get('error') if not activity.get('success', True) else None
-            )
-            
-            # 检查是否已存在相同的分析记录
-            existing = await analyses_collection.find_one({
-                "user_id": user['_id'],
-                "stock_code": stock_code,
-                "created_at": analysis_doc.created_at
-            })
+                'created_at': activity_time,
+                'completed_at': activity_time if success else None,
+                'error_message': activity['error'] if not success else None
+            }
             
-            if not existing:
-                await analyses_collection.insert_one(analysis_doc.dict(by_alias=True))
-                self.stats.analyses_migrated += 1
+            # 以 (用户, 股票代码, 创建时间) 为键upsert，已存在相同的分析记录时不做修改
+            return UpdateOne(
+                {
+                    "user_id": user_id,
+                    "stock_code": stock_code,
+                    "created_at": activity_time
+                },
+                {"$setOnInsert": analysis_doc},
+                upsert=True
+            )
                 
         except Exception as e:
             error_msg = f"处理活动记录失败: {str(e)}"
             self.logger.error(error_msg)
             self.stats.errors.append(error_msg)
+            return None
     
     def _detect_market_type(self, stock_code: str) -> MarketType:
         """根据股票代码检测市场类型"""
@@ -255,11 +536,11 @@ class StreamlitDataMigrator:
         stock_code = stock_code.upper()
         
         # 港股
-        if stock_code.startswith('HK') or (stock_code.isdigit() and len(stock_code) == 5):
+        if _HK_CODE_RE.match(stock_code):
             return MarketType.HK
         
         # 美股 (通常是字母)
-        if stock_code.isalpha() and len(stock_code) <= 5:
+        if _US_CODE_RE.match(stock_code):
             return MarketType.US
         
         # 默认A股
@@ -421,58 +702,59 @@ class StreamlitDataMigrator:
         }
         
         try:
-            db = await get_database()
+            db = await self._get_database()
+            
+            # 每个集合一次聚合同时得到总数和缺少关键字段的文档数，三个集合并发查询
+            (
+                (users_count, users_without_username),
+                (analyses_count, analyses_without_user),
+                (configs_count, configs_without_type)
+            ) = await asyncio.gather(
+                self._count_with_missing(db.users, "username"),
+                self._count_with_missing(db.analyses, "user_id"),
+                self._count_with_missing(db.configs, "config_type")
+            )
             
-            # 验证用户数据
-            users_count = await db.users.count_documents({})
             validation_results['users_count'] = users_count
-            
-            # 验证分析数据
-            analyses_count = await db.analyses.count_documents({})
             validation_results['analyses_count'] = analyses_count
-            
-            # 验证配置数据
-            configs_count = await db.configs.count_documents({})
             validation_results['configs_count'] = configs_count
             
             # 验证数据完整性
-            await self._validate_data_integrity(db, validation_results)
-            
-            self.logger.info(f"数据验证完成: {validation_results}")
-            
-        except Exception as e:
-            error_msg = f"数据验证失败: {str(e)}"
-            self.logger.error(error_msg)
-            validation_results['validation_errors'].append(error_msg)
-        
-        return validation_results
-    
-    async def _validate_data_integrity(self, db, validation_results: Dict[str, Any]) -> None:
-        """验证数据完整性"""
-        try:
-            # 检查用户数据完整性
-            users_without_username = await db.users.count_documents({"username": {"$exists": False}})
             if users_without_username > 0:
                 validation_results['validation_errors'].append(
                     f"发现 {users_without_username} 个用户缺少用户名"
                 )
-            
-            # 检查分析数据完整性
-            analyses_without_user = await db.analyses.count_documents({"user_id": {"$exists": False}})
             if analyses_without_user > 0:
                 validation_results['validation_errors'].append(
                     f"发现 {analyses_without_user} 个分析记录缺少用户ID"
                 )
-            
-            # 检查配置数据完整性
-            configs_without_type = await db.configs.count_documents({"config_type": {"$exists": False}})
             if configs_without_type > 0:
                 validation_results['validation_errors'].append(
                     f"发现 {configs_without_type} 个配置记录缺少配置类型"
                 )
             
+            self.logger.info(f"数据验证完成: {validation_results}")
+            
         except Exception as e:
-            validation_results['validation_errors'].append(f"数据完整性检查失败: {str(e)}")
+            error_msg = f"数据验证失败: {str(e)}"
+            self.logger.error(error_msg)
+            validation_results['validation_errors'].append(error_msg)
+        
+        return validation_results
+    
+    async def _count_with_missing(self, collection, field: str) -> Tuple[int, int]:
+        """通过一次 $facet 聚合返回 (集合文档总数, 缺少 field 的文档数)"""
+        result = await collection.aggregate([
+            {"$facet": {
+                "total": [{"$count": "n"}],
+                "missing": [{"$match": {field: {"$exists": False}}}, {"$count": "n"}]
+            }}
+        ]).to_list(1)
+        facet = result[0] if result else {}
+        # $count 在没有文档时不输出结果，对应的数组为空
+        total = facet.get("total") or [{"n": 0}]
+        missing = facet.get("missing") or [{"n": 0}]
+        return total[0]["n"], missing[0]["n"]
 
 
 async def main():
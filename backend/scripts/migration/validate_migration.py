@@ -6,14 +6,22 @@
 
 import os
 import sys
-import asyncio
 import json
+import asyncio
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import logging
 from dataclasses import dataclass
 
+import orjson
+
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
@@ -21,8 +29,11 @@ sys.path.insert(0, str(project_root))
 from backend.core.database import get_database
 from backend.core.redis_client import get_redis_client
 
+# 遍历迁移缓存键时每次 SCAN 请求返回的键数量提示
+CACHE_SCAN_COUNT = 1000
 
-@dataclass
+
+@dataclass(slots=True)
 class ValidationResult:
     """验证结果"""
     test_name: str
@@ -31,6 +42,33 @@ class ValidationResult:
     details: Optional[Dict[str, Any]] = None
 
 
+def _count_facet(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """$facet 中统计满足 match 条件的文档数的子管道"""
+    return [{"$match": match}, {"$count": "n"}]
+
+
+def _facet_count(facet: Dict[str, Any], name: str) -> int:
+    """读取 _count_facet 子管道的计数"""
+    # $count 在没有匹配文档时不输出结果，对应的数组为空
+    counted = facet.get(name)
+    return counted[0]["n"] if counted else 0
+
+
+def _has_index_on(index_info: Dict[str, Any], field: str) -> bool:
+    """index_information() 的结果中是否有包含 field 的索引"""
+    return any(
+        field == key for spec in index_info.values() for key, _ in spec['key']
+    )
+
+
+def _has_unique_index(index_info: Dict[str, Any], field: str) -> bool:
+    """index_information() 的结果中是否有只包含 field 的唯一索引"""
+    return any(
+        spec.get('unique') and [key for key, _ in spec['key']] == [field]
+        for spec in index_info.values()
+    )
+
+
 class MigrationValidator:
     """迁移数据验证器"""
     
@@ -47,14 +85,25 @@ class MigrationValidator:
             db = await get_database()
             redis_client = await get_redis_client()
             
-            # 运行各项验证测试
-            await self._validate_database_structure(db)
-            await self._validate_user_data(db)
-            await self._validate_analysis_data(db)
-            await self._validate_config_data(db)
-            await self._validate_cache_data(redis_client)
-            await self._validate_data_relationships(db)
-            await self._validate_data_integrity(db)
+            # 各项验证互不依赖，并发执行；各自返回结果列表，按固定顺序汇总
+            outcomes = await asyncio.gather(
+                self._validate_database_structure(db),
+                self._validate_user_data(db),
+                self._validate_analysis_data(db),
+                self._validate_config_data(db),
+                self._validate_cache_data(redis_client),
+                self._validate_data_relationships(db),
+                self._validate_data_integrity(db),
+                return_exceptions=True
+            )
+            for outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    self.logger.error(f"验证任务失败: {outcome}")
+                    self.validation_results.append(
+                        ValidationResult("validation_task", False, f"验证任务失败: {str(outcome)}")
+                    )
+                else:
+                    self.validation_results.extend(outcome)
             
             self.logger.info(f"验证完成，共 {len(self.validation_results)} 项测试")
             
@@ -66,8 +115,9 @@ class MigrationValidator:
         
         return self.validation_results
     
-    async def _validate_database_structure(self, db) -> None:
+    async def _validate_database_structure(self, db) -> List[ValidationResult]:
         """验证数据库结构"""
+        results: List[ValidationResult] = []
         try:
             # 检查必需的集合是否存在
             collections = await db.list_collection_names()
@@ -75,7 +125,7 @@ class MigrationValidator:
             
             for collection_name in required_collections:
                 if collection_name in collections:
-                    self.validation_results.append(
+                    results.append(
                         ValidationResult(
                             f"collection_{collection_name}_exists",
                             True,
@@ -83,7 +133,7 @@ class MigrationValidator:
                         )
                     )
                 else:
-                    self.validation_results.append(
+                    results.append(
                         ValidationResult(
                             f"collection_{collection_name}_exists",
                             False,
@@ -92,23 +142,28 @@ class MigrationValidator:
                     )
             
             # 检查索引
-            await self._validate_indexes(db)
+            results.extend(await self._validate_indexes(db))
             
         except Exception as e:
-            self.validation_results.append(
+            results.append(
                 ValidationResult("database_structure", False, f"数据库结构验证失败: {str(e)}")
             )
+        
+        return results
     
-    async def _validate_indexes(self, db) -> None:
+    async def _validate_indexes(self, db) -> List[ValidationResult]:
         """验证数据库索引"""
+        results: List[ValidationResult] = []
         try:
-            # 用户集合索引
-            user_indexes = await db.users.list_indexes().to_list(None)
-            username_index_exists = any(
-                'username' in idx.get('key', {}) for idx in user_indexes
+            user_indexes, analysis_indexes = await asyncio.gather(
+                db.users.index_information(),
+                db.analyses.index_information()
             )
             
-            self.validation_results.append(
+            # 用户集合索引
+            username_index_exists = _has_index_on(user_indexes, 'username')
+            
+            results.append(
                 ValidationResult(
                     "user_username_index",
                     username_index_exists,
@@ -117,12 +172,9 @@ class MigrationValidator:
             )
             
             # 分析集合索引
-            analysis_indexes = await db.analyses.list_indexes().to_list(None)
-            user_id_index_exists = any(
-                'user_id' in idx.get('key', {}) for idx in analysis_indexes
-            )
+            user_id_index_exists = _has_index_on(analysis_indexes, 'user_id')
             
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "analysis_user_id_index",
                     user_id_index_exists,
@@ -131,18 +183,21 @@ class MigrationValidator:
             )
             
         except Exception as e:
-            self.validation_results.append(
+            results.append(
                 ValidationResult("indexes_validation", False, f"索引验证失败: {str(e)}")
             )
+        
+        return results
     
-    async def _validate_user_data(self, db) -> None:
+    async def _validate_user_data(self, db) -> List[ValidationResult]:
         """验证用户数据"""
+        results: List[ValidationResult] = []
         try:
             users_collection = db.users
             
-            # 检查用户总数
-            total_users = await users_collection.count_documents({})
-            self.validation_results.append(
+            # 检查用户总数（无过滤条件的总数直接读取集合元数据，不扫描文档）
+            total_users = await users_collection.estimated_document_count()
+            results.append(
                 ValidationResult(
                     "user_count",
                     total_users > 0,
@@ -151,16 +206,30 @@ class MigrationValidator:
                 )
             )
             
-            # 检查用户数据完整性
-            users_without_username = await users_collection.count_documents({
-                "$or": [
-                    {"username": {"$exists": False}},
-                    {"username": ""},
-                    {"username": None}
+            # 用户名缺失、用户名重复和密码哈希缺失在一次 $facet 聚合中统计
+            # 等于 None 的条件同时匹配字段不存在的文档，不需要单独的 $exists: False 分支
+            facets = {
+                "missing_username": _count_facet({
+                    "username": {"$in": [None, ""]}
+                }),
+                "missing_password": _count_facet({
+                    "password_hash": {"$in": [None, ""]}
+                })
+            }
+            # 用户名上有唯一索引时不可能存在重复用户名，省去对整个集合的分组
+            # （$group 要读完全部输入才产出结果，$limit 无法让它提前结束）
+            if not _has_unique_index(await users_collection.index_information(), 'username'):
+                facets["duplicate_usernames"] = [
+                    {"$project": {"username": 1, "_id": 0}},
+                    {"$group": {"_id": "$username", "count": {"$sum": 1}}},
+                    {"$match": {"count": {"$gt": 1}}}
                 ]
-            })
+            facet = await self._run_facets(users_collection, facets)
             
-            self.validation_results.append(
+            # 检查用户数据完整性
+            users_without_username = _facet_count(facet, "missing_username")
+            
+            results.append(
                 ValidationResult(
                     "user_username_integrity",
                     users_without_username == 0,
@@ -170,13 +239,9 @@ class MigrationValidator:
             )
             
             # 检查用户名唯一性
-            pipeline = [
-                {"$group": {"_id": "$username", "count": {"$sum": 1}}},
-                {"$match": {"count": {"$gt": 1}}}
-            ]
-            duplicate_usernames = await users_collection.aggregate(pipeline).to_list(None)
+            duplicate_usernames = facet.get("duplicate_usernames", [])
             
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "user_username_uniqueness",
                     len(duplicate_usernames) == 0,
@@ -186,15 +251,9 @@ class MigrationValidator:
             )
             
             # 检查密码哈希
-            users_without_password = await users_collection.count_documents({
-                "$or": [
-                    {"password_hash": {"$exists": False}},
-                    {"password_hash": ""},
-                    {"password_hash": None}
-                ]
-            })
+            users_without_password = _facet_count(facet, "missing_password")
             
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "user_password_integrity",
                     users_without_password == 0,
@@ -204,18 +263,21 @@ class MigrationValidator:
             )
             
         except Exception as e:
-            self.validation_results.append(
+            results.append(
                 ValidationResult("user_data_validation", False, f"用户数据验证失败: {str(e)}")
             )
+        
+        return results
     
-    async def _validate_analysis_data(self, db) -> None:
+    async def _validate_analysis_data(self, db) -> List[ValidationResult]:
         """验证分析数据"""
+        results: List[ValidationResult] = []
         try:
             analyses_collection = db.analyses
             
             # 检查分析记录总数
-            total_analyses = await analyses_collection.count_documents({})
-            self.validation_results.append(
+            total_analyses = await analyses_collection.estimated_document_count()
+            results.append(
                 ValidationResult(
                     "analysis_count",
                     total_analyses >= 0,
@@ -225,15 +287,29 @@ class MigrationValidator:
             )
             
             if total_analyses > 0:
-                # 检查分析数据完整性
-                analyses_without_user = await analyses_collection.count_documents({
-                    "$or": [
-                        {"user_id": {"$exists": False}},
-                        {"user_id": None}
-                    ]
+                valid_statuses = ["pending", "running", "completed", "failed", "cancelled"]
+                facet = await self._run_facets(analyses_collection, {
+                    "missing_user_id": _count_facet({
+                        "user_id": None
+                    }),
+                    "missing_stock_code": _count_facet({
+                        "stock_code": {"$in": [None, ""]}
+                    }),
+                    "invalid_status": _count_facet({
+                        "status": {"$nin": valid_statuses}
+                    }),
+                    "invalid_progress": _count_facet({
+                        "$or": [
+                            {"progress": {"$lt": 0}},
+                            {"progress": {"$gt": 100}}
+                        ]
+                    })
                 })
                 
-                self.validation_results.append(
+                # 检查分析数据完整性
+                analyses_without_user = _facet_count(facet, "missing_user_id")
+                
+                results.append(
                     ValidationResult(
                         "analysis_user_id_integrity",
                         analyses_without_user == 0,
@@ -243,15 +319,9 @@ class MigrationValidator:
                 )
                 
                 # 检查股票代码
-                analyses_without_stock_code = await analyses_collection.count_documents({
-                    "$or": [
-                        {"stock_code": {"$exists": False}},
-                        {"stock_code": ""},
-                        {"stock_code": None}
-                    ]
-                })
+                analyses_without_stock_code = _facet_count(facet, "missing_stock_code")
                 
-                self.validation_results.append(
+                results.append(
                     ValidationResult(
                         "analysis_stock_code_integrity",
                         analyses_without_stock_code == 0,
@@ -261,12 +331,9 @@ class MigrationValidator:
                 )
                 
                 # 检查状态字段
-                valid_statuses = ["pending", "running", "completed", "failed", "cancelled"]
-                analyses_with_invalid_status = await analyses_collection.count_documents({
-                    "status": {"$nin": valid_statuses}
-                })
+                analyses_with_invalid_status = _facet_count(facet, "invalid_status")
                 
-                self.validation_results.append(
+                results.append(
                     ValidationResult(
                         "analysis_status_validity",
                         analyses_with_invalid_status == 0,
@@ -276,14 +343,9 @@ class MigrationValidator:
                 )
                 
                 # 检查进度字段
-                analyses_with_invalid_progress = await analyses_collection.count_documents({
-                    "$or": [
-                        {"progress": {"$lt": 0}},
-                        {"progress": {"$gt": 100}}
-                    ]
-                })
+                analyses_with_invalid_progress = _facet_count(facet, "invalid_progress")
                 
-                self.validation_results.append(
+                results.append(
                     ValidationResult(
                         "analysis_progress_validity",
                         analyses_with_invalid_progress == 0,
@@ -293,18 +355,21 @@ class MigrationValidator:
                 )
             
         except Exception as e:
-            self.validation_results.append(
+            results.append(
                 ValidationResult("analysis_data_validation", False, f"分析数据验证失败: {str(e)}")
             )
+        
+        return results
     
-    async def _validate_config_data(self, db) -> None:
+    async def _validate_config_data(self, db) -> List[ValidationResult]:
         """验证配置数据"""
+        results: List[ValidationResult] = []
         try:
             configs_collection = db.configs
             
             # 检查配置记录总数
-            total_configs = await configs_collection.count_documents({})
-            self.validation_results.append(
+            total_configs = await configs_collection.estimated_document_count()
+            results.append(
                 ValidationResult(
                     "config_count",
                     total_configs > 0,
@@ -313,13 +378,24 @@ class MigrationValidator:
                 )
             )
             
-            # 检查系统配置
-            system_configs = await configs_collection.count_documents({
-                "user_id": None,
-                "config_type": "system"
+            valid_config_types = ["llm", "data_source", "system", "user_preference"]
+            facet = await self._run_facets(configs_collection, {
+                "system": _count_facet({
+                    "user_id": None,
+                    "config_type": "system"
+                }),
+                "llm": _count_facet({
+                    "config_type": "llm"
+                }),
+                "invalid_type": _count_facet({
+                    "config_type": {"$nin": valid_config_types}
+                })
             })
             
-            self.validation_results.append(
+            # 检查系统配置
+            system_configs = _facet_count(facet, "system")
+            
+            results.append(
                 ValidationResult(
                     "system_config_exists",
                     system_configs > 0,
@@ -329,11 +405,9 @@ class MigrationValidator:
             )
             
             # 检查LLM配置
-            llm_configs = await configs_collection.count_documents({
-                "config_type": "llm"
-            })
+            llm_configs = _facet_count(facet, "llm")
             
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "llm_config_exists",
                     llm_configs > 0,
@@ -343,12 +417,9 @@ class MigrationValidator:
             )
             
             # 检查配置类型有效性
-            valid_config_types = ["llm", "data_source", "system", "user_preference"]
-            configs_with_invalid_type = await configs_collection.count_documents({
-                "config_type": {"$nin": valid_config_types}
-            })
+            configs_with_invalid_type = _facet_count(facet, "invalid_type")
             
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "config_type_validity",
                     configs_with_invalid_type == 0,
@@ -358,17 +429,32 @@ class MigrationValidator:
             )
             
         except Exception as e:
-            self.validation_results.append(
+            results.append(
                 ValidationResult("config_data_validation", False, f"配置数据验证失败: {str(e)}")
             )
+        
+        return results
     
-    async def _validate_cache_data(self, redis_client) -> None:
+    async def _validate_cache_data(self, redis_client) -> List[ValidationResult]:
         """验证缓存数据"""
+        results: List[ValidationResult] = []
         try:
-            # 检查Redis连接
-            await redis_client.ping()
-            
-            self.validation_results.append(
+            # 检查迁移的缓存条目：SCAN 分批遍历，不像 KEYS 那样阻塞Redis，也不在内存中保存全部键
+            migrated_cache_count = 0
+            sample_key = None
+            async for key in redis_client.scan_iter(match="migrated_cache:*", count=CACHE_SCAN_COUNT):
+                migrated_cache_count += 1
+                if sample_key is None:
+                    sample_key = key
+            
+            # 检查Redis连接，抽样条目的 GET 与 PING 在同一个 pipeline 中发送
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.ping()
+            if sample_key is not None:
+                pipe.get(sample_key)
+            replies = await pipe.execute()
+            
+            results.append(
                 ValidationResult(
                     "redis_connection",
                     True,
@@ -376,27 +462,24 @@ class MigrationValidator:
                 )
             )
             
-            # 检查迁移的缓存条目
-            migrated_cache_keys = await redis_client.keys("migrated_cache:*")
-            
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "migrated_cache_entries",
-                    len(migrated_cache_keys) >= 0,
-                    f"迁移的缓存条目数量: {len(migrated_cache_keys)}",
-                    {"count": len(migrated_cache_keys)}
+                    migrated_cache_count >= 0,
+                    f"迁移的缓存条目数量: {migrated_cache_count}",
+                    {"count": migrated_cache_count}
                 )
             )
             
             # 检查缓存数据完整性（随机抽样）
-            if migrated_cache_keys:
-                sample_key = migrated_cache_keys[0]
+            if sample_key is not None:
                 try:
-                    cache_data = await redis_client.get(sample_key)
+                    cache_data = replies[1]
                     if cache_data:
+                        # 缓存值由 json.dumps 写入，可能含有 NaN/Infinity，orjson 不接受这些值
                         json.loads(cache_data)  # 验证JSON格式
                         
-                        self.validation_results.append(
+                        results.append(
                             ValidationResult(
                                 "cache_data_format",
                                 True,
@@ -404,15 +487,15 @@ class MigrationValidator:
                             )
                         )
                     else:
-                        self.validation_results.append(
+                        results.append(
                             ValidationResult(
                                 "cache_data_format",
                                 False,
                                 "缓存数据为空"
                             )
                         )
-                except json.JSONDecodeError:
-                    self.validation_results.append(
+                except (json.JSONDecodeError, TypeError):
+                    results.append(
                         ValidationResult(
                             "cache_data_format",
                             False,
@@ -421,33 +504,26 @@ class MigrationValidator:
                     )
             
         except Exception as e:
-            self.validation_results.append(
+            results.append(
                 ValidationResult("cache_data_validation", False, f"缓存数据验证失败: {str(e)}")
             )
+        
+        return results
     
-    async def _validate_data_relationships(self, db) -> None:
+    async def _validate_data_relationships(self, db) -> List[ValidationResult]:
         """验证数据关系"""
+        results: List[ValidationResult] = []
         try:
             # 检查分析记录与用户的关系
             analyses_collection = db.analyses
-            users_collection = db.users
             
-            # 获取所有分析记录中的用户ID
-            pipeline = [
+            # 按用户ID分组后在服务端关联用户集合，统计用户不存在的用户ID数量
+            orphaned_analyses = await self._count_orphans(analyses_collection, [
                 {"$group": {"_id": "$user_id"}},
                 {"$match": {"_id": {"$ne": None}}}
-            ]
-            analysis_user_ids = await analyses_collection.aggregate(pipeline).to_list(None)
-            analysis_user_ids = [item["_id"] for item in analysis_user_ids]
-            
-            # 检查这些用户ID是否都存在于用户集合中
-            orphaned_analyses = 0
-            for user_id in analysis_user_ids:
-                user_exists = await users_collection.count_documents({"_id": user_id}) > 0
-                if not user_exists:
-                    orphaned_analyses += 1
+            ], "_id")
             
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "analysis_user_relationship",
                     orphaned_analyses == 0,
@@ -458,15 +534,12 @@ class MigrationValidator:
             
             # 检查配置记录与用户的关系
             configs_collection = db.configs
-            user_configs = await configs_collection.find({"user_id": {"$ne": None}}).to_list(None)
+            orphaned_configs = await self._count_orphans(configs_collection, [
+                {"$match": {"user_id": {"$ne": None}}},
+                {"$project": {"user_id": 1}}
+            ], "user_id")
             
-            orphaned_configs = 0
-            for config in user_configs:
-                user_exists = await users_collection.count_documents({"_id": config["user_id"]}) > 0
-                if not user_exists:
-                    orphaned_configs += 1
-            
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "config_user_relationship",
                     orphaned_configs == 0,
@@ -476,22 +549,26 @@ class MigrationValidator:
             )
             
         except Exception as e:
-            self.validation_results.append(
+            results.append(
                 ValidationResult("data_relationships_validation", False, f"数据关系验证失败: {str(e)}")
             )
+        
+        return results
     
-    async def _validate_data_integrity(self, db) -> None:
+    async def _validate_data_integrity(self, db) -> List[ValidationResult]:
         """验证数据完整性"""
+        results: List[ValidationResult] = []
         try:
             # 检查时间戳的合理性
             analyses_collection = db.analyses
+            now = datetime.utcnow()
             
             # 检查创建时间不能是未来时间
             future_analyses = await analyses_collection.count_documents({
-                "created_at": {"$gt": datetime.utcnow()}
+                "created_at": {"$gt": now}
             })
             
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "analysis_created_at_validity",
                     future_analyses == 0,
@@ -501,14 +578,15 @@ class MigrationValidator:
             )
             
             # 检查完成时间不能早于创建时间
-            invalid_completion_time = await analyses_collection.count_documents({
-                "$and": [
-                    {"completed_at": {"$exists": True, "$ne": None}},
-                    {"$expr": {"$lt": ["$completed_at", "$created_at"]}}
-                ]
-            })
-            
-            self.validation_results.append(
+            # 先用可走索引的条件筛出有完成时间的记录，再对剩余文档计算 $expr 比较
+            counted = await analyses_collection.aggregate([
+                {"$match": {"completed_at": {"$ne": None}}},
+                {"$match": {"$expr": {"$lt": ["$completed_at", "$created_at"]}}},
+                {"$count": "n"}
+            ]).to_list(1)
+            invalid_completion_time = counted[0]["n"] if counted else 0
+            
+            results.append(
                 ValidationResult(
                     "analysis_completion_time_validity",
                     invalid_completion_time == 0,
@@ -520,13 +598,10 @@ class MigrationValidator:
             # 检查已完成的分析是否有结果数据
             completed_without_results = await analyses_collection.count_documents({
                 "status": "completed",
-                "$or": [
-                    {"result_data": {"$exists": False}},
-                    {"result_data": None}
-                ]
+                "result_data": None
             })
             
-            self.validation_results.append(
+            results.append(
                 ValidationResult(
                     "completed_analysis_has_results",
                     completed_without_results == 0,
@@ -536,14 +611,49 @@ class MigrationValidator:
             )
             
         except Exception as e:
-            self.validation_results.append(
+            results.append(
                 ValidationResult("data_integrity_validation", False, f"数据完整性验证失败: {str(e)}")
             )
+        
+        return results
+    
+    async def _run_facets(self, collection, facets: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """在一次 $facet 聚合中运行多个子管道，返回以子管道名称为键的结果"""
+        # $group 子管道在大集合上可能超过服务端100MB的内存限制，允许落盘
+        result = await collection.aggregate([{"$facet": facets}], allowDiskUse=True).to_list(1)
+        return result[0] if result else {}
+    
+    async def _count_orphans(self, collection, pipeline: List[Dict[str, Any]], user_field: str) -> int:
+        """统计 pipeline 输出中 user_field 在用户集合里找不到对应用户的文档数
+        
+        用 $lookup 在服务端完成关联，代替逐个用户ID查询用户集合。
+        """
+        result = await collection.aggregate(pipeline + [
+            {"$lookup": {
+                "from": "users",
+                "localField": user_field,
+                "foreignField": "_id",
+                "as": "user"
+            }},
+            {"$match": {"user": {"$eq": []}}},
+            {"$count": "n"}
+        ], allowDiskUse=True).to_list(1)
+        return result[0]["n"] if result else 0
     
     def generate_report(self) -> Dict[str, Any]:
         """生成验证报告"""
-        passed_tests = sum(1 for result in self.validation_results if result.passed)
-        total_tests = len(self.validation_results)
+        # 一次遍历同时统计通过数并生成结果列表
+        passed_tests = 0
+        results = []
+        for result in self.validation_results:
+            passed_tests += result.passed
+            results.append({
+                "test_name": result.test_name,
+                "passed": result.passed,
+                "message": result.message,
+                "details": result.details
+            })
+        total_tests = len(results)
         
         report = {
             "summary": {
@@ -552,23 +662,7 @@ class MigrationValidator:
                 "failed_tests": total_tests - passed_tests,
                 "success_rate": (passed_tests / total_tests * 100) if total_tests > 0 else 0
             },
-            "results": [
-                {
-                    "test_name": result.test_name,
-                    "passed": result.passed,
-                    "message": result.message,
-                    "details": result.details
-                }
-                for result in self.validation_results
-            ],
-            "failed_tests": [
-                {
-                    "test_name": result.test_name,
-                    "message": result.message,
-                    "details": result.details
-                }
-                for result in self.validation_results if not result.passed
-            ]
+            "results": results
         }
         
         return report
@@ -596,9 +690,11 @@ async def main():
     print(f"失败测试: {report['summary']['failed_tests']}")
     print(f"成功率: {report['summary']['success_rate']:.1f}%")
     
-    if report['failed_tests']:
+    if report['summary']['failed_tests'] > 0:
         print(f"\n=== 失败的测试 ===")
-        for failed_test in report['failed_tests']:
+        for failed_test in report['results']:
+            if failed_test['passed']:
+                continue
             print(f"✗ {failed_test['test_name']}: {failed_test['message']}")
             if failed_test['details']:
                 print(f"  详情: {failed_test['details']}")
@@ -610,8 +706,8 @@ async def main():
     
     # 保存报告到文件
     report_file = project_root / "migration_validation_report.json"
-    with open(report_file, 'w', encoding='utf-8') as f:
-        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+    with open(report_file, 'wb') as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS, default=str))
     
     print(f"\n详细报告已保存到: {report_file}")
     
@@ -621,4 +717,7 @@ async def main():
 
 
 if __name__ == "__main__":
+    # 验证过程主要是数据库和Redis的网络等待，uvloop 的事件循环开销更低；未安装时使用默认事件循环
+    if UVLOOP_AVAILABLE:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     asyncio.run(main())
\ No newline at end of file
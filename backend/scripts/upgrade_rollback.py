@@ -6,30 +6,434 @@
 
 import os
 import sys
+import errno
+import functools
+import hashlib
+import importlib.util
+import signal
 import shutil
+import stat
+import tarfile
 import subprocess
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, Optional
 from datetime import datetime
 import logging
 import json
+import time
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# 安装了 zstandard 时备份写成单个 tar.zst 归档，否则按目录复制
+BACKUP_ARCHIVE_NAME = "backup.tar.zst"
+# 备份归档的默认 zstd 压缩级别，可通过 --compress-level 调整
+ZSTD_LEVEL = 3
+# 写入备份归档时读取源文件的默认缓冲区大小，可通过 --read-buffer-size 调整
+READ_BUFFER_SIZE = 1024 * 1024
+# 需要备份的配置文件（相对于项目根目录）
+CONFIG_FILES = (
+    "tradingagents/default_config.py",
+    ".env",
+    "config.yaml",
+    "config.json"
+)
+# 创建备份时并发执行复制任务的线程数
+BACKUP_COPY_WORKERS = 8
+
+# 内核复制接口单次调用请求的最大字节数，到达文件末尾时返回0
+KERNEL_COPY_CHUNK = 1 << 30
+# 用户态读写回退时的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+# 复制文件前向内核提示顺序读取（Linux 等 POSIX 平台）
+POSIX_FADVISE_AVAILABLE = hasattr(os, 'posix_fadvise')
+# 内核复制接口不支持当前文件或文件系统时的错误码，遇到时改用下一种复制方式
+_COPY_FALLBACK_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSOCK}
+# Windows 上复制目录树使用的 robocopy 及其线程数；shutil.copytree 在 Windows 上逐个文件复制非常慢
+ROBOCOPY_PATH = shutil.which("robocopy") if sys.platform == "win32" else None
+ROBOCOPY_THREADS = 64
+
+# 新后端服务的健康检查地址
+BACKEND_HEALTH_URL = "http://localhost:8000/api/legacy/health"
+# 等待新后端服务就绪的最长时间（秒）
+SERVICE_READY_TIMEOUT = 30.0
+# 升级验证时API兼容性测试的最长等待时间（秒）
+API_CHECK_TIMEOUT = 10.0
+# 单次健康检查请求的超时时间（秒）
+HEALTH_PROBE_TIMEOUT = 2.0
+# 就绪轮询的初始间隔和最大间隔（秒）
+READY_POLL_INITIAL_INTERVAL = 0.1
+READY_POLL_MAX_INTERVAL = 1.0
+# 前端服务没有健康检查接口，启动后观察进程是否退出的时间（秒）
+FRONTEND_STARTUP_GRACE = 5.0
+# 记录升级时启动的新系统服务 PID 的文件（位于备份目录中）
+SERVICES_PID_FILE = "new_services.json"
+# 停止服务时等待进程退出的时间（秒），超时后强制结束
+SERVICE_STOP_TIMEOUT = 5.0
+# 解压时的安全过滤器（Python 3.12 及安全更新后的 3.8+ 提供），拒绝写到目标目录之外的成员、设备文件等
+TAR_DATA_FILTER_AVAILABLE = hasattr(tarfile, 'data_filter')
+# 计算数据目录指纹时忽略的文件：数据迁移自己写入的断点文件（streamlit_data_migrator.ACTIVITY_CHECKPOINT_FILE），
+# 否则每次迁移都会改变指纹，下次升级永远无法跳过数据迁移
+FINGERPRINT_IGNORED_NAMES = frozenset({".migration_checkpoint", ".migration_checkpoint.tmp"})
+# 迁移和验证脚本失败时写入日志的输出末尾字节数，完整输出保存在备份目录的日志文件中
+LOG_TAIL_BYTES = 64 * 1024
+
+
+def _copy_file_data(src_fd: int, dst_fd: int) -> None:
+    """把 src_fd 的全部内容写入 dst_fd
+    
+    依次尝试 copy_file_range（同一文件系统上可由文件系统直接克隆数据块）、
+    sendfile，最后回退到用户态读写循环；前两种方式的数据不经过用户态缓冲区。
+    """
+    copied = 0
+    
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while True:
+                sent = os.copy_file_range(src_fd, dst_fd, KERNEL_COPY_CHUNK)
+                if sent == 0:
+                    if copied:
+                        return
+                    # 首次调用就返回0不一定是空文件：跨文件系统复制（Linux 5.3-5.18）、
+                    # 部分 FUSE/NFS 以及 /proc、/sys 文件不复制任何数据也返回0，改用下一种方式
+                    break
+                copied += sent
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+    
+    if hasattr(os, 'sendfile'):
+        try:
+            while True:
+                sent = os.sendfile(dst_fd, src_fd, copied, KERNEL_COPY_CHUNK)
+                if sent == 0:
+                    if copied:
+                        return
+                    # 同上，首次调用返回0时由读写循环确认是否为空文件
+                    break
+                copied += sent
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+    
+    os.lseek(src_fd, copied, os.SEEK_SET)
+    while True:
+        buf = os.read(src_fd, COPY_BUFFER_SIZE)
+        if not buf:
+            return
+        os.write(dst_fd, buf)
+
+
+def _copystat_from(st: os.stat_result, dst: str) -> None:
+    """把已取得的源文件状态中的时间戳和权限应用到 dst
+    
+    代替 shutil.copystat，避免再次 stat 源文件。
+    """
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.chmod(dst, stat.S_IMODE(st.st_mode))
+
+
+def _fastcopyfile(src: str, dst: str, src_stat: os.stat_result) -> None:
+    """复制单个文件的内容，并按 src_stat 设置权限和时间戳，功能对应 shutil.copy2"""
+    binary = getattr(os, 'O_BINARY', 0)
+    # O_SEQUENTIAL 仅 Windows 提供，对应 FILE_FLAG_SEQUENTIAL_SCAN
+    src_fd = os.open(src, os.O_RDONLY | binary | getattr(os, 'O_SEQUENTIAL', 0))
+    try:
+        if POSIX_FADVISE_AVAILABLE:
+            # 提示内核按顺序读取整个文件：加大预读窗口并立即开始读入
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | binary, 0o600)
+        try:
+            _copy_file_data(src_fd, dst_fd)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    _copystat_from(src_stat, dst)
+
+
+def _is_same_version(src_stat: os.stat_result, path: str) -> bool:
+    """path 是否与 src_stat 描述的文件大小和修改时间都相同"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return st.st_size == src_stat.st_size and st.st_mtime_ns == src_stat.st_mtime_ns
+
+
+def _fastcopytree(src: str, dst: str, src_stat: os.stat_result = None,
+                  link_base: Optional[str] = None) -> None:
+    """复制目录树，功能对应 shutil.copytree 的默认行为（跟随符号链接）
+    
+    用 os.scandir 遍历，目录项类型直接取自目录读取结果，每个条目只 stat 一次，
+    结果同时用于设置复制后的权限和时间戳；文件内容通过 _copy_file_data 在内核中复制。
+    
+    link_base 为上一次备份中对应的目录时，其中大小和修改时间都未变化的文件
+    直接创建硬链接，不复制数据。
+    """
+    if src_stat is None:
+        src_stat = os.stat(src)
+    os.mkdir(dst)
+    with os.scandir(src) as entries:
+        for entry in entries:
+            dst_path = os.path.join(dst, entry.name)
+            entry_stat = entry.stat()
+            base_path = os.path.join(link_base, entry.name) if link_base else None
+            if entry.is_dir():
+                if base_path and not os.path.isdir(base_path):
+                    base_path = None
+                _fastcopytree(entry.path, dst_path, entry_stat, base_path)
+                continue
+            # 与 shutil.copytree 一致，拒绝复制命名管道、套接字和设备文件；打开 FIFO 读取会一直阻塞
+            if not stat.S_ISREG(entry_stat.st_mode):
+                raise shutil.SpecialFileError(f"`{entry.path}` 不是普通文件")
+            
+            if base_path and _is_same_version(entry_stat, base_path):
+                try:
+                    os.link(base_path, dst_path)
+                    continue
+                except OSError:
+                    # 文件系统不支持硬链接时改为复制
+                    pass
+            _fastcopyfile(entry.path, dst_path, entry_stat)
+    _copystat_from(src_stat, dst)
+
+
+def _collect_tree_entries(root: str, prefix: str, entries_out: list) -> None:
+    """递归收集 root 下所有文件的 (相对路径, 大小, 修改时间ns)，stat 结果取自 os.scandir 的目录项缓存"""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.name in FINGERPRINT_IGNORED_NAMES:
+                continue
+            rel_path = f"{prefix}/{entry.name}"
+            if entry.is_dir():
+                _collect_tree_entries(entry.path, rel_path, entries_out)
+                continue
+            entry_stat = entry.stat()
+            entries_out.append((rel_path, entry_stat.st_size, entry_stat.st_mtime_ns))
+
+
+def _tree_fingerprint(roots: dict) -> str:
+    """计算若干目录树的变化指纹
+    
+    roots 为 名称 -> 目录路径，只遍历目录、不读取文件内容；任一文件新增、删除、
+    大小或修改时间变化时指纹随之变化。不存在的目录按空目录处理。
+    """
+    file_entries = []
+    for name, root in roots.items():
+        if os.path.isdir(root):
+            _collect_tree_entries(root, name, file_entries)
+    
+    digest = hashlib.blake2b(digest_size=16)
+    for rel_path, size, mtime_ns in sorted(file_entries):
+        digest.update(f"{rel_path}\0{size}\0{mtime_ns}\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def _process_start_time(pid: int) -> Optional[str]:
+    """返回进程的启动时间标识，进程不存在或无法获取时返回 None
+    
+    PID 会被系统复用，启动时间与记录时一致才说明仍是同一个进程。
+    Linux 上读取 /proc/<pid>/stat 的 starttime 字段，其他平台安装了 psutil 时使用 psutil。
+    """
+    try:
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            stat_line = f.read()
+        # comm 字段可能含有空格和括号，从最后一个 ')' 之后切分；starttime 是第22个字段
+        return stat_line[stat_line.rindex(b')') + 2:].split()[19].decode()
+    except (OSError, ValueError, IndexError):
+        pass
+    if PSUTIL_AVAILABLE:
+        try:
+            return str(psutil.Process(pid).create_time())
+        except psutil.Error:
+            pass
+    return None
+
+
+def _stop_process_group(pid: int, process: Optional[subprocess.Popen] = None,
+                        timeout: float = SERVICE_STOP_TIMEOUT) -> None:
+    """停止以 start_new_session=True 启动的服务进程及其子进程
+    
+    POSIX 上服务进程的 PID 即进程组ID，先向整个进程组发送 SIGTERM，超时后发送 SIGKILL；
+    Windows 上直接结束进程。process 为空时（进程由其他脚本实例启动）轮询进程是否已退出。
+    """
+    if sys.platform == "win32":
+        try:
+            if process is not None:
+                process.kill()
+            else:
+                os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+        return
+    
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    
+    if process is not None:
+        try:
+            process.wait(timeout=timeout)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+    else:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return
+            time.sleep(0.1)
+    
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _read_log_tail(path: str, size: int = LOG_TAIL_BYTES) -> str:
+    """读取日志文件末尾最多 size 字节"""
+    with open(path, 'rb') as f:
+        f.seek(max(os.fstat(f.fileno()).st_size - size, 0))
+        return f.read().decode('utf-8', errors='replace')
+
+
+def _dump_json(path: str, data: dict) -> None:
+    """以缩进格式写入 JSON 文件，安装了 orjson 时使用 orjson"""
+    if ORJSON_AVAILABLE:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+def _load_json(path: str) -> dict:
+    """读取 JSON 文件，安装了 orjson 时使用 orjson"""
+    if ORJSON_AVAILABLE:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _read_backup_info(backup_dir: str) -> Optional[dict]:
+    """读取备份目录中的 backup_info.json，文件不存在时返回 None"""
+    try:
+        return _load_json(os.path.join(backup_dir, "backup_info.json"))
+    except FileNotFoundError:
+        return None
+
+
+def _is_safe_member_name(name: str) -> bool:
+    """归档成员路径是否为不含 .. 的相对路径"""
+    if name.startswith('/') or os.path.isabs(name):
+        return False
+    return '..' not in name.replace('\\', '/').split('/')
+
+
+def _extract_member(tar: tarfile.TarFile, member: tarfile.TarInfo, path: str) -> None:
+    """把归档成员解压到 path 下，有 data 过滤器时使用它做完整的安全检查"""
+    if TAR_DATA_FILTER_AVAILABLE:
+        tar.extract(member, path, filter='data')
+    else:
+        tar.extract(member, path)
+
+
+def _copytree(src: str, dst: str) -> None:
+    """复制目录树，Windows 上有 robocopy 时交给它多线程复制，其他情况使用 _fastcopytree"""
+    if sys.platform == "win32" and ROBOCOPY_PATH:
+        result = subprocess.run(
+            [ROBOCOPY_PATH, str(src), str(dst), "/E", f"/MT:{ROBOCOPY_THREADS}",
+             "/COPY:DAT", "/DCOPY:T", "/NFL", "/NDL", "/NJH", "/NJS", "/NP"],
+            stdout=subprocess.DEVNULL
+        )
+        # robocopy 的返回码小于8表示成功（各位表示复制了文件、存在额外文件等情况）
+        if result.returncode >= 8:
+            raise OSError(f"robocopy 复制 {src} 失败，返回码: {result.returncode}")
+        return
+    
+    _fastcopytree(src, dst)
+
 
 class UpgradeRollbackManager:
     """升级回滚管理器"""
     
-    def __init__(self):
+    # 新系统运行所需的Python包
+    _REQUIRED_PACKAGES = ("fastapi", "uvicorn", "motor", "redis", "pydantic")
+    
+    def __init__(self, compress_level: int = ZSTD_LEVEL, compress_threads: int = -1,
+                 read_buffer_size: int = READ_BUFFER_SIZE, incremental: bool = False,
+                 dev: bool = False):
+        """
+        Args:
+            compress_level: 备份归档的 zstd 压缩级别
+            compress_threads: zstd 压缩线程数，-1 表示使用全部CPU核心
+            read_buffer_size: 写入备份归档时读取源文件的缓冲区大小（字节）
+            incremental: 是否创建增量备份（目录格式，未变化的文件硬链接到上一次目录格式的备份）
+            dev: 开发模式，新后端服务以热重载方式启动
+        """
         self.project_root = project_root
+        self.compress_level = compress_level
+        self.compress_threads = compress_threads
+        self.read_buffer_size = read_buffer_size
+        self.incremental = incremental
+        self.dev = dev
         self.backup_dir = self.project_root / "upgrade_backups"
         self.logger = logging.getLogger(__name__)
+        # 需要备份的数据目录，每项为 (备份中的名称, 数据目录路径, 日志中的名称)
+        # 路径只计算一次，并以字符串形式直接传给 os 和 shutil 的函数
+        self._data_trees = (
+            ("web_data", str(self.project_root / "web" / "data"), "Web数据"),
+            ("analysis_data", str(self.project_root / "data"), "分析数据")
+        )
+        # 需要备份的配置文件路径
+        self._config_paths = tuple(str(self.project_root / config_file) for config_file in CONFIG_FILES)
+        # 本进程启动的新系统服务进程，服务名 -> 进程
+        self._service_processes: Dict[str, subprocess.Popen] = {}
+        # 健康检查复用的HTTP会话，首次使用时创建
+        self._http = None
         
         # 确保备份目录存在
         self.backup_dir.mkdir(exist_ok=True)
     
+    def __enter__(self) -> "UpgradeRollbackManager":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        """关闭健康检查使用的HTTP会话"""
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+    
     def create_backup(self) -> str:
         """创建系统备份"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -39,37 +443,35 @@ class UpgradeRollbackManager:
         try:
             self.logger.info(f"创建系统备份到: {backup_path}")
             
-            # 备份数据目录
-            if (self.project_root / "web" / "data").exists():
-                shutil.copytree(
-                    self.project_root / "web" / "data",
-                    backup_path / "web_data"
-                )
-                self.logger.info("✓ Web数据备份完成")
+            # 备份前记录数据目录的变化指纹，升级时据此判断数据迁移是否可以跳过
+            source_fingerprint = _tree_fingerprint({name: path for name, path, _ in self._data_trees})
             
-            if (self.project_root / "data").exists():
-                shutil.copytree(
-                    self.project_root / "data",
-                    backup_path / "analysis_data"
-                )
-                self.logger.info("✓ 分析数据备份完成")
+            # 需要备份的数据目录和配置文件，每项为 (源路径, 备份中的名称, 完成时日志中的名称)
+            sources = []
             
-            # 备份配置文件
-            config_backup = backup_path / "configs"
-            config_backup.mkdir(exist_ok=True)
-            
-            config_files = [
-                "tradingagents/default_config.py",
-                ".env",
-                "config.yaml",
-                "config.json"
-            ]
+            # 备份数据目录
+            for name, path, label in self._data_trees:
+                if os.path.exists(path):
+                    sources.append((path, name, label))
             
-            for config_file in config_files:
-                config_path = self.project_root / config_file
-                if config_path.exists():
-                    shutil.copy2(config_path, config_backup / config_path.name)
+            # 备份配置文件
+            for config_path in self._config_paths:
+                if os.path.exists(config_path):
+                    sources.append((config_path, f"configs/{os.path.basename(config_path)}", None))
             
+            incremental_base = None
+            if self.incremental:
+                incremental_base = self._write_incremental_backup(backup_path, sources)
+            elif ZSTD_AVAILABLE:
+                # 流式写入单个压缩归档，一次顺序写入代替大量小文件的复制
+                self._write_backup_archive(backup_path / BACKUP_ARCHIVE_NAME, sources)
+            else:
+                # 未安装 zstandard 时逐项复制，各项互不依赖，在线程池中并发执行
+                (backup_path / "configs").mkdir(exist_ok=True)
+                self._run_copy_jobs([
+                    (_copytree if os.path.isdir(src) else shutil.copy2, src, backup_path / name, label)
+                    for src, name, label in sources
+                ])
             self.logger.info("✓ 配置文件备份完成")
             
             # 创建备份信息文件
@@ -77,14 +479,16 @@ class UpgradeRollbackManager:
                 "timestamp": timestamp,
                 "backup_path": str(backup_path),
                 "created_at": datetime.now().isoformat(),
+                "format": "tar.zst" if ZSTD_AVAILABLE and not self.incremental else "directory",
+                "incremental_base": incremental_base,
+                "source_fingerprint": source_fingerprint,
                 "system_info": {
                     "python_version": sys.version,
                     "platform": sys.platform
                 }
             }
             
-            with open(backup_path / "backup_info.json", 'w') as f:
-                json.dump(backup_info, f, indent=2)
+            _dump_json(backup_path / "backup_info.json", backup_info)
             
             self.logger.info(f"✓ 系统备份创建完成: {backup_path}")
             return str(backup_path)
@@ -93,19 +497,112 @@ class UpgradeRollbackManager:
             self.logger.error(f"创建备份失败: {e}")
             return ""
     
+    def _write_incremental_backup(self, backup_path: Path, sources: list) -> Optional[str]:
+        """以目录格式创建增量备份，返回作为基准的上一次备份路径
+        
+        数据目录中与基准备份大小和修改时间都相同的文件使用硬链接，只有新增和修改的文件
+        占用空间；没有目录格式的备份可作为基准时创建完整的目录备份。
+        """
+        base = next(
+            (info['backup_path'] for info in self.list_backups()
+             if info.get('format', 'directory') == 'directory' and os.path.isdir(info['backup_path'])),
+            None
+        )
+        if base:
+            self.logger.info(f"增量备份基准: {base}")
+        else:
+            self.logger.info("没有可作为基准的目录格式备份，创建完整备份")
+        
+        copy_jobs = []
+        for src, name, label in sources:
+            dst = backup_path / name
+            if not os.path.isdir(src):
+                copy_jobs.append((shutil.copy2, src, dst, label))
+                continue
+            link_base = os.path.join(base, name) if base else None
+            if link_base and not os.path.isdir(link_base):
+                link_base = None
+            copy_jobs.append((functools.partial(_fastcopytree, link_base=link_base), src, dst, label))
+        
+        (backup_path / "configs").mkdir(exist_ok=True)
+        self._run_copy_jobs(copy_jobs)
+        return base
+    
+    def _write_backup_archive(self, archive_path: Path, sources: list) -> None:
+        """把备份内容流式写入 tar.zst 归档"""
+        compressor = zstandard.ZstdCompressor(level=self.compress_level, threads=self.compress_threads)
+        start_time = time.monotonic()
+        # dereference=True 与目录复制一致，归档符号链接指向的内容
+        with open(archive_path, 'wb') as f, \
+                compressor.stream_writer(f) as writer, \
+                tarfile.open(fileobj=writer, mode='w|', dereference=True,
+                             bufsize=self.read_buffer_size,
+                             copybufsize=self.read_buffer_size) as tar:
+            for src, name, label in sources:
+                tar.add(src, arcname=name)
+                if label:
+                    self.logger.info(f"✓ {label}备份完成")
+        
+        # 记录写入吞吐量，用于调整压缩级别和线程数：受限于压缩时提高线程数或降低级别，受限于磁盘时可提高级别
+        elapsed = time.monotonic() - start_time
+        archive_mib = archive_path.stat().st_size / (1024 * 1024)
+        self.logger.info(
+            f"备份归档大小: {archive_mib:.1f} MiB，耗时 {elapsed:.1f} 秒，"
+            f"写入速度: {archive_mib / elapsed if elapsed > 0 else 0:.1f} MiB/s"
+        )
+    
+    def _run_copy_jobs(self, copy_jobs: list) -> None:
+        """在线程池中并发执行复制任务
+        
+        任一任务失败时取消尚未开始的任务，并抛出第一个失败任务的异常。
+        """
+        if not copy_jobs:
+            return
+        
+        with ThreadPoolExecutor(max_workers=min(BACKUP_COPY_WORKERS, len(copy_jobs))) as executor:
+            futures = {
+                executor.submit(copy_func, src, dst): label
+                for copy_func, src, dst, label in copy_jobs
+            }
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    if futures[future]:
+                        self.logger.info(f"✓ {futures[future]}备份完成")
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+    
     def perform_upgrade(self) -> bool:
-        """执行系统升级"""
+        """执行系统升级
+        
+        步骤之间的依赖关系：
+            创建备份 ─┐
+                      ├─> 启动新系统服务 -> 数据迁移 -> 验证升级结果
+            检查依赖 ─┘
+        创建备份（磁盘IO）与检查依赖（导入检查、npm install）互不依赖，并发执行。
+        
+        数据目录的指纹与上一次成功完成数据迁移时相同时跳过数据迁移。
+        """
         try:
             self.logger.info("开始系统升级...")
             
-            # 1. 创建备份
-            backup_path = self.create_backup()
+            # 上一次成功完成数据迁移时的数据目录指纹，需在创建本次备份前读取
+            migrated_fingerprint = self._last_migrated_fingerprint()
+            
+            # 1. 创建备份，同时 2. 检查新系统依赖
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                backup_future = executor.submit(self.create_backup)
+                dependencies_future = executor.submit(self._check_dependencies)
+                backup_path = backup_future.result()
+                dependencies_ok = dependencies_future.result()
+            
             if not backup_path:
                 self.logger.error("备份创建失败，升级中止")
                 return False
             
-            # 2. 检查新系统依赖
-            if not self._check_dependencies():
+            if not dependencies_ok:
                 self.logger.error("依赖检查失败，升级中止")
                 return False
             
@@ -115,10 +612,18 @@ class UpgradeRollbackManager:
                 return False
             
             # 4. 执行数据迁移
-            if not self._run_data_migration():
+            backup_info = _read_backup_info(backup_path) or {}
+            source_fingerprint = backup_info.get("source_fingerprint")
+            if source_fingerprint and source_fingerprint == migrated_fingerprint:
+                self.logger.info("数据目录自上次迁移后未变化，跳过数据迁移")
+            elif not self._run_data_migration():
                 self.logger.error("数据迁移失败，开始回滚")
                 self.rollback_from_backup(backup_path)
                 return False
+            elif source_fingerprint:
+                # 记录本次迁移对应的数据指纹，供下次升级判断
+                backup_info["data_migrated"] = True
+                _dump_json(os.path.join(backup_path, "backup_info.json"), backup_info)
             
             # 5. 验证升级结果
             if not self._validate_upgrade():
@@ -133,6 +638,13 @@ class UpgradeRollbackManager:
             self.logger.error(f"升级过程失败: {e}")
             return False
     
+    def _last_migrated_fingerprint(self) -> Optional[str]:
+        """最近一次成功完成数据迁移的备份记录的数据目录指纹，没有时返回 None"""
+        for info in self.list_backups():
+            if info.get("data_migrated"):
+                return info.get("source_fingerprint")
+        return None
+    
     def rollback_from_backup(self, backup_path: str) -> bool:
         """从备份回滚系统"""
         try:
@@ -146,32 +658,14 @@ class UpgradeRollbackManager:
             # 1. 停止新系统服务
             self._stop_new_services()
             
-            # 2. 恢复数据目录
-            if (backup_path / "web_data").exists():
-                if (self.project_root / "web" / "data").exists():
-                    shutil.rmtree(self.project_root / "web" / "data")
-                shutil.copytree(
-                    backup_path / "web_data",
-                    self.project_root / "web" / "data"
-                )
-                self.logger.info("✓ Web数据恢复完成")
-            
-            if (backup_path / "analysis_data").exists():
-                if (self.project_root / "data").exists():
-                    shutil.rmtree(self.project_root / "data")
-                shutil.copytree(
-                    backup_path / "analysis_data",
-                    self.project_root / "data"
-                )
-                self.logger.info("✓ 分析数据恢复完成")
-            
-            # 3. 恢复配置文件
-            config_backup = backup_path / "configs"
-            if config_backup.exists():
-                for config_file in config_backup.iterdir():
-                    target_path = self.project_root / config_file.name
-                    shutil.copy2(config_file, target_path)
-                self.logger.info("✓ 配置文件恢复完成")
+            # 2. 恢复数据目录和配置文件
+            # 被替换的现有数据目录改名后在后台线程中删除，删除与恢复同时进行
+            with ThreadPoolExecutor(max_workers=len(self._data_trees)) as cleanup:
+                archive_path = backup_path / BACKUP_ARCHIVE_NAME
+                if archive_path.exists():
+                    self._restore_backup_archive(archive_path, cleanup)
+                else:
+                    self._restore_backup_directory(backup_path, cleanup)
             
             # 4. 启动旧系统
             self._start_old_services()
@@ -183,20 +677,103 @@ class UpgradeRollbackManager:
             self.logger.error(f"回滚失败: {e}")
             return False
     
+    def _detach_tree(self, path: str, cleanup: ThreadPoolExecutor) -> None:
+        """把现有目录改名让出原路径，并交给 cleanup 在后台删除
+        
+        改名只修改目录项，调用方可以立即在原路径恢复数据，不必等待删除整个目录树。
+        """
+        if not os.path.exists(path):
+            return
+        
+        stale_path = f"{path}.rollback_{os.getpid()}_{time.monotonic_ns()}"
+        os.rename(path, stale_path)
+        
+        def log_failure(future):
+            if future.exception() is not None:
+                self.logger.warning(f"删除被替换的目录 {stale_path} 失败: {future.exception()}")
+        
+        cleanup.submit(shutil.rmtree, stale_path).add_done_callback(log_failure)
+    
+    def _restore_backup_directory(self, backup_path: Path, cleanup: ThreadPoolExecutor) -> None:
+        """从按目录复制的备份恢复数据目录和配置文件"""
+        # 恢复数据目录
+        for name, path, label in self._data_trees:
+            backup_tree = backup_path / name
+            if backup_tree.exists():
+                self._detach_tree(path, cleanup)
+                _copytree(backup_tree, path)
+                self.logger.info(f"✓ {label}恢复完成")
+        
+        # 恢复配置文件
+        config_backup = backup_path / "configs"
+        if config_backup.exists():
+            for config_file in config_backup.iterdir():
+                target_path = self.project_root / config_file.name
+                shutil.copy2(config_file, target_path)
+            self.logger.info("✓ 配置文件恢复完成")
+    
+    def _restore_backup_archive(self, archive_path: Path, cleanup: ThreadPoolExecutor) -> None:
+        """从 tar.zst 归档流式恢复数据目录和配置文件"""
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("恢复 tar.zst 备份需要安装 zstandard")
+        
+        # 归档中的顶层名称 -> (恢复到的目录, 日志中的名称)
+        targets = {name: (path, label) for name, path, label in self._data_trees}
+        restored = []
+        configs_restored = False
+        
+        decompressor = zstandard.ZstdDecompressor()
+        with open(archive_path, 'rb') as f, \
+                decompressor.stream_reader(f) as reader, \
+                tarfile.open(fileobj=reader, mode='r|') as tar:
+            for member in tar:
+                # 拒绝绝对路径和包含 .. 的成员（及链接目标），防止被篡改的归档写到恢复目录之外
+                if not _is_safe_member_name(member.name) or \
+                        ((member.issym() or member.islnk()) and not _is_safe_member_name(member.linkname)):
+                    self.logger.warning(f"跳过路径不安全的归档成员: {member.name}")
+                    continue
+                top, _, rest = member.name.partition('/')
+                
+                if top == "configs":
+                    if not rest:
+                        continue
+                    member.name = rest
+                    _extract_member(tar, member, self.project_root)
+                    configs_restored = True
+                    continue
+                
+                if top not in targets:
+                    continue
+                target, label = targets[top]
+                # 同一目录树的成员在归档中是连续的，遇到第一个成员时替换现有目录
+                if label not in restored:
+                    self._detach_tree(target, cleanup)
+                    restored.append(label)
+                target_parent, target_name = os.path.split(target)
+                member.name = f"{target_name}/{rest}" if rest else target_name
+                # 硬链接的目标同样是归档中的名称，随成员一起映射到恢复后的目录名
+                if member.islnk():
+                    link_top, _, link_rest = member.linkname.partition('/')
+                    if link_top == top:
+                        member.linkname = f"{target_name}/{link_rest}"
+                _extract_member(tar, member, target_parent)
+        
+        for label in restored:
+            self.logger.info(f"✓ {label}恢复完成")
+        if configs_restored:
+            self.logger.info("✓ 配置文件恢复完成")
+    
     def _check_dependencies(self) -> bool:
         """检查新系统依赖"""
         try:
-            # 检查Python依赖
-            required_packages = [
-                "fastapi", "uvicorn", "motor", "redis", "pydantic"
+            # 检查Python依赖：find_spec 只查找模块位置，不执行包的初始化代码，汇总后一次报告所有缺少的包
+            missing_packages = [
+                package for package in self._REQUIRED_PACKAGES
+                if importlib.util.find_spec(package) is None
             ]
-            
-            for package in required_packages:
-                try:
-                    __import__(package)
-                except ImportError:
-                    self.logger.error(f"缺少依赖包: {package}")
-                    return False
+            if missing_packages:
+                self.logger.error(f"缺少依赖包: {', '.join(missing_packages)}")
+                return False
             
             # 检查Node.js依赖（如果需要）
             frontend_dir = self.project_root / "frontend"
@@ -225,25 +802,30 @@ class UpgradeRollbackManager:
         """启动新系统服务"""
         try:
             # 启动后端服务
+            # 服务进程长期运行，放在独立的会话中，脱离本脚本的控制终端和进程组；
+            # 本脚本不读取服务输出，输出不接管道，避免管道写满或本脚本退出后服务写入失败
             backend_cmd = [
                 sys.executable, "-m", "uvicorn", "main:app",
-                "--host", "0.0.0.0", "--port", "8000", "--reload"
+                "--host", "0.0.0.0", "--port", "8000"
             ]
+            # 热重载会额外启动监控进程和文件监视，只在开发时启用
+            if self.dev:
+                backend_cmd.append("--reload")
             
             backend_process = subprocess.Popen(
                 backend_cmd,
                 cwd=self.project_root / "backend",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True
             )
+            self._track_service("backend", backend_process)
             
-            # 等待服务启动
-            import time
-            time.sleep(5)
-            
-            # 检查服务是否正常运行
-            if backend_process.poll() is not None:
+            # 等待服务就绪：轮询健康检查接口，就绪后立即继续，进程退出时立即判定失败
+            if not self._wait_ready(BACKEND_HEALTH_URL, backend_process):
                 self.logger.error("后端服务启动失败")
+                # 超时未就绪但仍在运行的进程不再保留
+                _stop_process_group(backend_process.pid, backend_process)
                 return False
             
             # 启动前端服务（如果存在）
@@ -253,13 +835,18 @@ class UpgradeRollbackManager:
                 frontend_process = subprocess.Popen(
                     frontend_cmd,
                     cwd=frontend_dir,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    start_new_session=True
                 )
+                self._track_service("frontend", frontend_process)
                 
-                time.sleep(5)
-                if frontend_process.poll() is not None:
+                # 前端没有健康检查接口，观察一段时间内进程是否退出，退出时立即返回
+                try:
+                    frontend_process.wait(timeout=FRONTEND_STARTUP_GRACE)
                     self.logger.warning("前端服务启动失败，但继续升级")
+                except subprocess.TimeoutExpired:
+                    pass
             
             self.logger.info("✓ 新系统服务启动完成")
             return True
@@ -268,14 +855,88 @@ class UpgradeRollbackManager:
             self.logger.error(f"启动新系统服务失败: {e}")
             return False
     
+    def _track_service(self, name: str, process: subprocess.Popen) -> None:
+        """记录启动的服务进程，并把 PID 和进程启动时间写入文件，供单独执行的回滚停止这些服务"""
+        self._service_processes[name] = process
+        _dump_json(
+            self.backup_dir / SERVICES_PID_FILE,
+            {
+                service: {"pid": p.pid, "start_time": _process_start_time(p.pid)}
+                for service, p in self._service_processes.items()
+            }
+        )
+    
+    def _wait_ready(self, url: str, process: Optional[subprocess.Popen] = None,
+                    timeout: float = SERVICE_READY_TIMEOUT) -> bool:
+        """轮询 url 直到返回200，轮询间隔按指数退避增长
+        
+        process 不为空时进程退出即返回 False；超过 timeout 秒仍未就绪返回 False。
+        """
+        import requests
+        
+        # 就绪轮询和升级验证反复请求同一个地址，复用会话中的连接，省去每次建立连接
+        if self._http is None:
+            self._http = requests.Session()
+            self._http.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            if process is not None and process.poll() is not None:
+                return False
+            
+            try:
+                if self._http.get(url, timeout=HEALTH_PROBE_TIMEOUT).status_code == 200:
+                    return True
+            except requests.RequestException:
+                pass
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(READY_POLL_INITIAL_INTERVAL * 2 ** attempt, READY_POLL_MAX_INTERVAL, remaining))
+            attempt += 1
+    
     def _stop_new_services(self) -> bool:
         """停止新系统服务"""
         try:
-            # 停止后端服务
-            subprocess.run(["pkill", "-f", "uvicorn main:app"], check=False)
+            # 本进程启动的服务直接使用进程句柄；单独执行回滚时从 PID 文件读取升级时启动的服务
+            pid_file = self.backup_dir / SERVICES_PID_FILE
+            if self._service_processes:
+                services = {name: (process.pid, process) for name, process in self._service_processes.items()}
+            elif pid_file.exists():
+                services = {}
+                for name, record in _load_json(pid_file).items():
+                    # PID 文件可能是几天前写入的，PID 可能已被其他进程复用：
+                    # 只有启动时间与记录一致时才认为仍是当时启动的服务，否则不发送信号
+                    pid = record.get("pid") if isinstance(record, dict) else record
+                    start_time = record.get("start_time") if isinstance(record, dict) else None
+                    current_start_time = _process_start_time(pid)
+                    if current_start_time is None:
+                        self.logger.info(f"{name} 服务 (PID {pid}) 已不存在或无法确认，跳过")
+                        continue
+                    if start_time is None or current_start_time != start_time:
+                        self.logger.warning(f"PID {pid} 已不是升级时启动的 {name} 服务，跳过")
+                        continue
+                    services[name] = (pid, None)
+            else:
+                services = {}
+            
+            # 逐个停止，一个服务失败（如无权限）不影响停止其他服务
+            all_stopped = True
+            for name, (pid, process) in services.items():
+                try:
+                    _stop_process_group(pid, process)
+                    self.logger.info(f"已停止 {name} 服务 (PID {pid})")
+                except OSError as e:
+                    all_stopped = False
+                    self.logger.error(f"停止 {name} 服务 (PID {pid}) 失败: {e}")
             
-            # 停止前端服务
-            subprocess.run(["pkill", "-f", "npm start"], check=False)
+            self._service_processes.clear()
+            if not all_stopped:
+                # 保留 PID 文件，重新执行回滚时再次尝试停止
+                return False
+            pid_file.unlink(missing_ok=True)
             
             self.logger.info("✓ 新系统服务已停止")
             return True
@@ -293,8 +954,9 @@ class UpgradeRollbackManager:
             subprocess.Popen(
                 old_app_cmd,
                 cwd=self.project_root / "web",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True
             )
             
             self.logger.info("✓ 旧系统服务已启动")
@@ -312,15 +974,10 @@ class UpgradeRollbackManager:
                 "--type", "full"
             ]
             
-            result = subprocess.run(
-                migration_cmd,
-                cwd=self.project_root,
-                capture_output=True,
-                text=True
-            )
+            returncode, log_path = self._run_logged(migration_cmd, "migration")
             
-            if result.returncode != 0:
-                self.logger.error(f"数据迁移失败: {result.stderr}")
+            if returncode != 0:
+                self.logger.error(f"数据迁移失败，完整输出见 {log_path}:\n{_read_log_tail(log_path)}")
                 return False
             
             self.logger.info("✓ 数据迁移完成")
@@ -330,6 +987,22 @@ class UpgradeRollbackManager:
             self.logger.error(f"数据迁移失败: {e}")
             return False
     
+    def _run_logged(self, cmd: list, name: str) -> tuple:
+        """运行脚本，标准输出和标准错误直接写入备份目录中的日志文件
+        
+        输出不经过本进程的管道缓冲，内存占用与脚本输出量无关。返回 (返回码, 日志文件路径)。
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_path = str(self.backup_dir / f"{name}_{timestamp}.log")
+        with open(log_path, 'wb') as log_file:
+            result = subprocess.run(
+                cmd,
+                cwd=self.project_root,
+                stdout=log_file,
+                stderr=subprocess.STDOUT
+            )
+        return result.returncode, log_path
+    
     def _validate_upgrade(self) -> bool:
         """验证升级结果"""
         try:
@@ -338,26 +1011,15 @@ class UpgradeRollbackManager:
                 sys.executable, "backend/scripts/migration/validate_migration.py"
             ]
             
-            result = subprocess.run(
-                validation_cmd,
-                cwd=self.project_root,
-                capture_output=True,
-                text=True
-            )
+            returncode, log_path = self._run_logged(validation_cmd, "validation")
             
-            if result.returncode != 0:
-                self.logger.error(f"升级验证失败: {result.stderr}")
+            if returncode != 0:
+                self.logger.error(f"升级验证失败，完整输出见 {log_path}:\n{_read_log_tail(log_path)}")
                 return False
             
             # 测试API兼容性
-            try:
-                import requests
-                response = requests.get("http://localhost:8000/api/legacy/health", timeout=10)
-                if response.status_code != 200:
-                    self.logger.error("API兼容性测试失败")
-                    return False
-            except Exception as e:
-                self.logger.error(f"API测试失败: {e}")
+            if not self._wait_ready(BACKEND_HEALTH_URL, timeout=API_CHECK_TIMEOUT):
+                self.logger.error("API兼容性测试失败")
                 return False
             
             self.logger.info("✓ 升级验证通过")
@@ -372,13 +1034,16 @@ class UpgradeRollbackManager:
         backups = []
         
         try:
-            for backup_dir in self.backup_dir.iterdir():
-                if backup_dir.is_dir() and backup_dir.name.startswith("backup_"):
-                    info_file = backup_dir / "backup_info.json"
-                    if info_file.exists():
-                        with open(info_file, 'r') as f:
-                            backup_info = json.load(f)
-                        backups.append(backup_info)
+            with os.scandir(self.backup_dir) as entries:
+                backup_dirs = [
+                    entry.path for entry in entries
+                    if entry.name.startswith("backup_") and entry.is_dir()
+                ]
+            
+            # 各备份的信息文件互不依赖，在线程池中并发读取
+            if backup_dirs:
+                with ThreadPoolExecutor(max_workers=min(BACKUP_COPY_WORKERS, len(backup_dirs))) as executor:
+                    backups = [info for info in executor.map(_read_backup_info, backup_dirs) if info]
             
             # 按时间排序
             backups.sort(key=lambda x: x['created_at'], reverse=True)
@@ -407,6 +1072,34 @@ def main():
         default="INFO",
         help="日志级别"
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="创建增量备份：与最近一次目录格式备份相同的文件使用硬链接，不再复制"
+    )
+    parser.add_argument(
+        "--dev",
+        action="store_true",
+        help="开发模式：新后端服务以 --reload 热重载方式启动"
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        default=ZSTD_LEVEL,
+        help="备份归档的 zstd 压缩级别"
+    )
+    parser.add_argument(
+        "--compress-threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="备份归档的 zstd 压缩线程数"
+    )
+    parser.add_argument(
+        "--read-buffer-size",
+        type=int,
+        default=READ_BUFFER_SIZE,
+        help="写入备份归档时读取源文件的缓冲区大小（字节）"
+    )
     
     args = parser.parse_args()
     
@@ -416,51 +1109,56 @@ def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
-    manager = UpgradeRollbackManager()
-    
-    if args.action == "backup":
-        backup_path = manager.create_backup()
-        if backup_path:
-            print(f"✓ 备份创建成功: {backup_path}")
-        else:
-            print("✗ 备份创建失败")
-            sys.exit(1)
-    
-    elif args.action == "upgrade":
-        success = manager.perform_upgrade()
-        if success:
-            print("✓ 系统升级成功")
-        else:
-            print("✗ 系统升级失败")
-            sys.exit(1)
-    
-    elif args.action == "rollback":
-        if not args.backup_path:
-            # 使用最新的备份
-            backups = manager.list_backups()
-            if not backups:
-                print("✗ 没有可用的备份")
+    with UpgradeRollbackManager(
+        compress_level=args.compress_level,
+        compress_threads=args.compress_threads,
+        read_buffer_size=args.read_buffer_size,
+        incremental=args.incremental,
+        dev=args.dev
+    ) as manager:
+        if args.action == "backup":
+            backup_path = manager.create_backup()
+            if backup_path:
+                print(f"✓ 备份创建成功: {backup_path}")
+            else:
+                print("✗ 备份创建失败")
                 sys.exit(1)
-            backup_path = backups[0]['backup_path']
-        else:
-            backup_path = args.backup_path
         
-        success = manager.rollback_from_backup(backup_path)
-        if success:
-            print(f"✓ 系统回滚成功: {backup_path}")
-        else:
-            print("✗ 系统回滚失败")
-            sys.exit(1)
-    
-    elif args.action == "list-backups":
-        backups = manager.list_backups()
-        if backups:
-            print("可用的备份:")
-            for backup in backups:
-                print(f"  - {backup['timestamp']}: {backup['backup_path']}")
-                print(f"    创建时间: {backup['created_at']}")
-        else:
-            print("没有可用的备份")
+        elif args.action == "upgrade":
+            success = manager.perform_upgrade()
+            if success:
+                print("✓ 系统升级成功")
+            else:
+                print("✗ 系统升级失败")
+                sys.exit(1)
+        
+        elif args.action == "rollback":
+            if not args.backup_path:
+                # 使用最新的备份
+                backups = manager.list_backups()
+                if not backups:
+                    print("✗ 没有可用的备份")
+                    sys.exit(1)
+                backup_path = backups[0]['backup_path']
+            else:
+                backup_path = args.backup_path
+            
+            success = manager.rollback_from_backup(backup_path)
+            if success:
+                print(f"✓ 系统回滚成功: {backup_path}")
+            else:
+                print("✗ 系统回滚失败")
+                sys.exit(1)
+        
+        elif args.action == "list-backups":
+            backups = manager.list_backups()
+            if backups:
+                print("可用的备份:")
+                for backup in backups:
+                    print(f"  - {backup['timestamp']}: {backup['backup_path']}")
+                    print(f"    创建时间: {backup['created_at']}")
+            else:
+                print("没有可用的备份")
 
 
 if __name__ == "__main__":
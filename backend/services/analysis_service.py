@@ -8,6 +8,7 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
 
 from models.user import UserInDB
 from models.analysis import (
@@ -28,6 +29,11 @@ from tradingagents.default_config import DEFAULT_CONFIG
 from tradingagents.utils.logging_manager import get_logger
 logger = get_logger('analysis_service')
 
+# 进度写入的合并间隔（秒），间隔内的多次进度更新合并为一次Redis和一次MongoDB写入
+PROGRESS_FLUSH_INTERVAL = 0.5
+# Redis中实时进度的过期时间（秒）
+PROGRESS_TTL = 3600
+
 
 class AnalysisService:
     """Service for executing stock analysis tasks"""
@@ -36,6 +42,14 @@ class AnalysisService:
         self.db = db
         self.redis = redis_client
         self._trading_graphs = {}  # Cache for TradingAgentsGraph instances
+        
+        # 进度缓冲：_update_progress 只更新内存中的进度，由延迟任务合并写入Redis和MongoDB
+        self._progress_cache: Dict[str, Dict[str, Any]] = {}  # analysis_id -> 最新的进度数据
+        self._started_at: Dict[str, Optional[datetime]] = {}  # analysis_id -> 分析开始时间
+        self._pending_progress: Dict[str, Dict[str, Any]] = {}  # 待写入Redis的进度数据
+        self._pending_db_progress: Dict[str, float] = {}  # 待写入MongoDB的进度值
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()  # 串行化写入，保证先取出的进度先落地
     
     async def execute_analysis(
         self,
@@ -62,11 +76,9 @@ class AnalysisService:
             
             # Update progress with detailed steps
             await self._update_progress(analysis_id, 5.0, "🔍 验证股票代码和市场信息...", "数据验证")
-            await asyncio.sleep(1)  # 让用户看到这个步骤
             
             # Prepare analysis parameters
             await self._update_progress(analysis_id, 10.0, "⚙️ 配置分析参数和模型设置...", "参数配置")
-            await asyncio.sleep(1)
             stock_code = analysis_request.stock_code
             analysis_date = analysis_request.analysis_date or datetime.now().strftime("%Y-%m-%d")
             
@@ -77,9 +89,7 @@ class AnalysisService:
             
             # Update progress
             await self._update_progress(analysis_id, 15.0, "🚀 初始化AI分析引擎...", "引擎初始化")
-            await asyncio.sleep(1)
             await self._update_progress(analysis_id, 20.0, "🤖 加载智能分析模型...", "模型加载")
-            await asyncio.sleep(1)
             
             # Execute the analysis
             final_state, decision = await self._run_trading_analysis(
@@ -100,6 +110,10 @@ class AnalysisService:
             
             logger.info(f"✅ Analysis {analysis_id} completed successfully")
             
+        except asyncio.CancelledError:
+            # 任务被取消时不会进入 _fail_analysis，这里丢弃该分析缓冲的进度，状态由取消方写入
+            self._discard_progress(analysis_id)
+            raise
         except Exception as e:
             logger.error(f"❌ Analysis {analysis_id} failed: {str(e)}")
             logger.error(traceback.format_exc())
@@ -383,24 +397,49 @@ class AnalysisService:
         if progress is not None:
             update_data["progress"] = progress
         
-        # 如果状态变为RUNNING，且数据库中还没有started_at，则设置开始时间
-        if status == AnalysisStatus.RUNNING:
-            # 检查数据库中是否已经有started_at
-            analysis_doc = await self.db.analyses.find_one({"_id": ObjectId(analysis_id)})
-            if analysis_doc and not analysis_doc.get("started_at"):
-                update_data["started_at"] = datetime.utcnow()
-                logger.info(f"🚀 Analysis {analysis_id} started at {update_data['started_at']}")
-        elif status in [AnalysisStatus.COMPLETED, AnalysisStatus.FAILED, AnalysisStatus.CANCELLED]:
+        if status in [AnalysisStatus.COMPLETED, AnalysisStatus.FAILED, AnalysisStatus.CANCELLED]:
             update_data["completed_at"] = datetime.utcnow()
         
         if message:
             if status == AnalysisStatus.FAILED:
                 update_data["error_message"] = message
         
-        await self.db.analyses.update_one(
+        # 如果状态变为RUNNING，且数据库中还没有started_at，则设置开始时间
+        if status == AnalysisStatus.RUNNING:
+            now = datetime.utcnow()
+            # MongoDB 的日期精度为毫秒，截断后才能与写入后返回的值比较
+            now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+            started_at = await self._write_state(analysis_id, started_at=now, **update_data)
+            if started_at == now:
+                logger.info(f"🚀 Analysis {analysis_id} started at {started_at}")
+            self._started_at[analysis_id] = started_at
+        else:
+            await self._write_state(analysis_id, **update_data)
+    
+    async def _write_state(self, analysis_id: str, started_at: datetime = None, **fields) -> Optional[datetime]:
+        """
+        用一次写入更新分析记录的状态、进度和时间戳等字段
+        
+        传入 started_at 时只在记录还没有开始时间时写入，并返回记录最终的开始时间，
+        判断和写入在同一次 find_one_and_update 中完成，不需要先读取记录。
+        """
+        if started_at is None:
+            await self.db.analyses.update_one(
+                {"_id": ObjectId(analysis_id)},
+                {"$set": fields}
+            )
+            return None
+        
+        # 管道式更新中的值按表达式解析，普通字段用 $literal 原样写入
+        update_stage = {field: {"$literal": value} for field, value in fields.items()}
+        update_stage["started_at"] = {"$ifNull": ["$started_at", started_at]}
+        analysis_doc = await self.db.analyses.find_one_and_update(
             {"_id": ObjectId(analysis_id)},
-            {"$set": update_data}
+            [{"$set": update_stage}],
+            projection={"started_at": 1},
+            return_document=ReturnDocument.AFTER
         )
+        return analysis_doc.get("started_at") if analysis_doc else None
     
     async def _update_progress(
         self,
@@ -414,16 +453,24 @@ class AnalysisService:
     ):
         """
         Update analysis progress in Redis for real-time updates
+        
+        进度先合并到内存中，PROGRESS_FLUSH_INTERVAL 秒后由 _flush_progress 批量写入
+        （Redis pipeline 一次往返，MongoDB 一次 bulk_write）。
         """
         # 计算已用时间
         elapsed_time = 0
         estimated_remaining = 0
         
         try:
-            # 从数据库获取分析开始时间
-            analysis_doc = await self.db.analyses.find_one({"_id": ObjectId(analysis_id)})
-            if analysis_doc and analysis_doc.get("started_at"):
-                started_at = analysis_doc["started_at"]
+            # 分析开始时间每个分析只从数据库读取一次
+            if analysis_id not in self._started_at:
+                analysis_doc = await self.db.analyses.find_one(
+                    {"_id": ObjectId(analysis_id)},
+                    {"started_at": 1}
+                )
+                self._started_at[analysis_id] = analysis_doc.get("started_at") if analysis_doc else None
+            started_at = self._started_at[analysis_id]
+            if started_at:
                 elapsed_time = (datetime.utcnow() - started_at).total_seconds()
                 
                 # 根据当前进度估算剩余时间
@@ -435,17 +482,19 @@ class AnalysisService:
         
         redis_key = f"analysis_progress:{analysis_id}"
 
-        # 读取现有进度，避免覆盖已有的progress字段
-        existing_progress_data = {}
-        try:
-            cached_progress = await self.redis.get(redis_key)
-            if cached_progress:
-                existing_progress_data = json.loads(cached_progress)
-        except Exception as e:
-            logger.warning(f"Failed to load existing progress from Redis: {e}")
+        # 读取现有进度，避免覆盖已有的progress字段；Redis中的进度只在首次更新时读取，之后以内存中的为准
+        progress_data = self._progress_cache.get(analysis_id)
+        if progress_data is None:
+            progress_data = {}
+            try:
+                cached_progress = await self.redis.get(redis_key)
+                if cached_progress:
+                    progress_data = json.loads(cached_progress)
+            except Exception as e:
+                logger.warning(f"Failed to load existing progress from Redis: {e}")
+            self._progress_cache[analysis_id] = progress_data
 
         # 构建进度数据，默认继承已有字段
-        progress_data = dict(existing_progress_data or {})
         progress_data.update({
             "status": "running",  # 添加状态信息
             "elapsed_time": elapsed_time,
@@ -476,11 +525,7 @@ class AnalysisService:
             progress_data["llm_result"] = llm_result
         if analyst_type:
             progress_data["analyst_type"] = analyst_type
-        await self.redis.setex(
-            redis_key,
-            3600,  # 1 hour TTL
-            json.dumps(progress_data)
-        )
+        self._pending_progress[analysis_id] = progress_data
         
         # 添加调试日志
         if progress is not None:
@@ -490,33 +535,103 @@ class AnalysisService:
         
         # 只在有进度值时更新数据库
         if progress is not None:
-            await self.db.analyses.update_one(
-                {"_id": ObjectId(analysis_id)},
-                {"$set": {"progress": progress}}
+            self._pending_db_progress[analysis_id] = progress
+        
+        # 间隔内已有待执行的写入时合并到该次写入
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_progress_later())
+    
+    async def _flush_progress_later(self):
+        """等待 PROGRESS_FLUSH_INTERVAL 秒后写入缓冲的进度"""
+        # 写入期间到达的进度不会再创建任务，由本任务在下一个间隔写入
+        while True:
+            await asyncio.sleep(PROGRESS_FLUSH_INTERVAL)
+            try:
+                await self._flush_progress()
+            except Exception as e:
+                logger.error(f"Failed to flush analysis progress: {e}")
+            if not self._pending_progress and not self._pending_db_progress:
+                break
+    
+    async def _flush_progress(self):
+        """
+        把缓冲的进度写入Redis和MongoDB
+        """
+        async with self._flush_lock:
+            pending, self._pending_progress = self._pending_progress, {}
+            pending_db, self._pending_db_progress = self._pending_db_progress, {}
+            await self._write_progress(pending, pending_db)
+    
+    async def _write_progress(self, pending: Dict[str, Dict[str, Any]], pending_db: Dict[str, float]):
+        if pending:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for analysis_id, progress_data in pending.items():
+                    pipe.setex(f"analysis_progress:{analysis_id}", PROGRESS_TTL, json.dumps(progress_data))
+                await pipe.execute()
+        
+        if pending_db:
+            await self.db.analyses.bulk_write(
+                [
+                    UpdateOne({"_id": ObjectId(analysis_id)}, {"$set": {"progress": progress}})
+                    for analysis_id, progress in pending_db.items()
+                ],
+                ordered=False
             )
     
+    async def _drain_progress(self, analysis_id: str):
+        """
+        分析结束前写入该分析缓冲的进度，避免结束后的写入覆盖最终状态
+        
+        其他分析的进度留在缓冲中，由已计划的延迟写入任务照常写入；
+        持有 _flush_lock 写入，正在进行的写入会先完成，不会晚于最终状态落地。
+        """
+        async with self._flush_lock:
+            pending = {}
+            pending_db = {}
+            if analysis_id in self._pending_progress:
+                pending[analysis_id] = self._pending_progress.pop(analysis_id)
+            if analysis_id in self._pending_db_progress:
+                pending_db[analysis_id] = self._pending_db_progress.pop(analysis_id)
+            try:
+                await self._write_progress(pending, pending_db)
+            except Exception as e:
+                logger.error(f"Failed to flush analysis progress: {e}")
+        self._progress_cache.pop(analysis_id, None)
+        self._started_at.pop(analysis_id, None)
+    
+    def _discard_progress(self, analysis_id: str):
+        """
+        丢弃该分析缓冲的进度和内存状态（分析被取消时调用）
+        """
+        self._pending_progress.pop(analysis_id, None)
+        self._pending_db_progress.pop(analysis_id, None)
+        self._progress_cache.pop(analysis_id, None)
+        self._started_at.pop(analysis_id, None)
+    
     async def _complete_analysis(self, analysis_id: str, result_data: AnalysisResult):
         """
         Mark analysis as completed with results
         """
-        await self.db.analyses.update_one(
-            {"_id": ObjectId(analysis_id)},
-            {
-                "$set": {
-                    "status": AnalysisStatus.COMPLETED.value,
-                    "progress": 100.0,
-                    "result_data": result_data.dict(),
-                    "completed_at": datetime.utcnow()
-                }
-            }
+        await self._drain_progress(analysis_id)
+        
+        result_dict = result_data.dict()
+        await self._write_state(
+            analysis_id,
+            status=AnalysisStatus.COMPLETED.value,
+            progress=100.0,
+            result_data=result_dict,
+            completed_at=datetime.utcnow()
         )
         
-        # Cache result in Redis
-        await self.redis.setex(
-            f"analysis_result:{analysis_id}",
-            86400,  # 24 hours TTL
-            json.dumps(result_data.dict())
-        )
+        # Cache result in Redis and clean up progress cache (one round trip)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.setex(
+                f"analysis_result:{analysis_id}",
+                86400,  # 24 hours TTL
+                json.dumps(result_dict)
+            )
+            pipe.delete(f"analysis_progress:{analysis_id}")
+            await pipe.execute()
         
         # 🔧 新增：保存分析结果到MongoDB（用于历史记录和报告管理）
         try:
@@ -524,27 +639,23 @@ class AnalysisService:
         except Exception as e:
             logger.error(f"Failed to save analysis to MongoDB: {e}")
             # 不影响主流程，继续执行
-        
-        # Clean up progress cache
-        await self.redis.delete(f"analysis_progress:{analysis_id}")
     
     async def _fail_analysis(self, analysis_id: str, error_message: str):
         """
         Mark analysis as failed with error message
         """
-        await self.db.analyses.update_one(
-            {"_id": ObjectId(analysis_id)},
-            {
-                "$set": {
-                    "status": AnalysisStatus.FAILED.value,
-                    "error_message": error_message,
-                    "completed_at": datetime.utcnow()
-                }
-            }
-        )
+        await self._drain_progress(analysis_id)
         
-        # Clean up progress cache
-        await self.redis.delete(f"analysis_progress:{analysis_id}")
+        # 更新数据库状态与清理进度缓存互不依赖，并发执行
+        await asyncio.gather(
+            self._write_state(
+                analysis_id,
+                status=AnalysisStatus.FAILED.value,
+                error_message=error_message,
+                completed_at=datetime.utcnow()
+            ),
+            self.redis.delete(f"analysis_progress:{analysis_id}")
+        )
     
     async def _is_cancelled(self, analysis_id: str) -> bool:
         """
@@ -0,0 +1,118 @@
+"""
+Tests for the migration bulk writer
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from pymongo import InsertOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from ..scripts.migration.bulk import AsyncBulkWriter
+
+
+def make_collection(bulk_write=None):
+    """Create a mock collection whose bulk_write reports every op as inserted"""
+    collection = MagicMock()
+    collection.name = "analyses"
+
+    async def default_bulk_write(ops, ordered=True):
+        result = MagicMock()
+        result.bulk_api_result = {"nInserted": len(ops), "nUpserted": 0, "nModified": 0}
+        return result
+
+    collection.bulk_write = AsyncMock(side_effect=bulk_write or default_bulk_write)
+    return collection
+
+
+class TestAsyncBulkWriter:
+    """Test batching and error collection"""
+
+    @pytest.mark.asyncio
+    async def test_submits_full_batches_and_remainder(self):
+        """Test ops are written in batch_size chunks and the remainder on close"""
+        collection = make_collection()
+
+        async with AsyncBulkWriter(collection, batch_size=3) as writer:
+            for i in range(7):
+                await writer.submit(InsertOne({"i": i}))
+
+        batch_sizes = [len(call.args[0]) for call in collection.bulk_write.call_args_list]
+        assert batch_sizes == [3, 3, 1]
+        for call in collection.bulk_write.call_args_list:
+            assert call.kwargs["ordered"] is False
+        assert writer.inserted_count == 7
+        assert writer.errors == []
+
+    @pytest.mark.asyncio
+    async def test_close_without_ops_does_not_write(self):
+        """Test closing an empty writer issues no bulk_write"""
+        collection = make_collection()
+
+        writer = AsyncBulkWriter(collection, batch_size=3)
+        await writer.aclose()
+
+        collection.bulk_write.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_bulk_write_error_records_counts_and_errors(self):
+        """Test per-op write errors are collected and successful ops are counted"""
+        async def failing_bulk_write(ops, ordered=True):
+            raise BulkWriteError({
+                "nInserted": len(ops) - 1,
+                "nUpserted": 0,
+                "nModified": 0,
+                "writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}]
+            })
+
+        collection = make_collection(failing_bulk_write)
+
+        async with AsyncBulkWriter(collection, batch_size=2) as writer:
+            for i in range(4):
+                await writer.submit(InsertOne({"i": i}))
+
+        assert writer.inserted_count == 2
+        assert len(writer.errors) == 2
+        assert all("duplicate key" in error for error in writer.errors)
+
+    @pytest.mark.asyncio
+    async def test_background_batch_exception_is_recorded(self):
+        """Test a non-BulkWriteError raised in a background batch is reported in errors"""
+        async def disconnected_bulk_write(ops, ordered=True):
+            raise AutoReconnect("connection closed")
+
+        collection = make_collection(disconnected_bulk_write)
+
+        async with AsyncBulkWriter(collection, batch_size=2, max_concurrency=2) as writer:
+            for i in range(3):
+                await writer.submit(InsertOne({"i": i}))
+
+        assert writer.inserted_count == 0
+        assert len(writer.errors) == 2
+        assert "connection closed" in writer.errors[0]
+        # 信号量在异常后释放，后续批次仍能提交
+        assert collection.bulk_write.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_max_concurrency_limits_inflight_batches(self):
+        """Test no more than max_concurrency batches are written at the same time"""
+        running = 0
+        peak = 0
+
+        async def slow_bulk_write(ops, ordered=True):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            result = MagicMock()
+            result.bulk_api_result = {"nInserted": len(ops)}
+            return result
+
+        collection = make_collection(slow_bulk_write)
+
+        async with AsyncBulkWriter(collection, batch_size=1, max_concurrency=2) as writer:
+            for i in range(6):
+                await writer.submit(InsertOne({"i": i}))
+
+        assert peak == 2
+        assert writer.inserted_count == 6
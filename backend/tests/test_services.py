@@ -0,0 +1,230 @@
+"""
+Tests for analysis service state writes and progress buffering
+"""
+import asyncio
+import json
+import pytest
+from datetime import datetime, timedelta
+from bson import ObjectId
+from unittest.mock import AsyncMock, MagicMock
+from pymongo import ReturnDocument
+
+from ..models.analysis import AnalysisStatus
+from ..services import analysis_service as analysis_service_module
+from ..services.analysis_service import AnalysisService
+
+
+class TestWriteState:
+    """Test single-call analysis state writes"""
+
+    @pytest.mark.asyncio
+    async def test_without_started_at_uses_plain_set(self, mock_redis):
+        """Test fields are written with one $set update"""
+        db = MagicMock()
+        db.analyses.update_one = AsyncMock()
+        db.analyses.find_one_and_update = AsyncMock()
+        service = AnalysisService(db, mock_redis)
+        analysis_id = str(ObjectId())
+
+        result = await service._write_state(analysis_id, status="failed", error_message="boom")
+
+        assert result is None
+        db.analyses.update_one.assert_awaited_once_with(
+            {"_id": ObjectId(analysis_id)},
+            {"$set": {"status": "failed", "error_message": "boom"}}
+        )
+        db.analyses.find_one_and_update.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_with_started_at_uses_pipeline_update(self, mock_redis):
+        """Test started_at is only set when missing and the stored value is returned"""
+        stored_started_at = datetime(2024, 1, 15, 9, 30)
+        db = MagicMock()
+        db.analyses.find_one_and_update = AsyncMock(return_value={"started_at": stored_started_at})
+        service = AnalysisService(db, mock_redis)
+        analysis_id = str(ObjectId())
+        now = datetime(2024, 1, 15, 10, 0)
+
+        result = await service._write_state(analysis_id, started_at=now, status="running", progress=0.0)
+
+        assert result == stored_started_at
+        db.analyses.find_one_and_update.assert_awaited_once_with(
+            {"_id": ObjectId(analysis_id)},
+            [{"$set": {
+                "status": {"$literal": "running"},
+                "progress": {"$literal": 0.0},
+                "started_at": {"$ifNull": ["$started_at", now]}
+            }}],
+            projection={"started_at": 1},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @pytest.mark.asyncio
+    async def test_with_started_at_missing_document(self, mock_redis):
+        """Test a missing analysis returns None"""
+        db = MagicMock()
+        db.analyses.find_one_and_update = AsyncMock(return_value=None)
+        service = AnalysisService(db, mock_redis)
+
+        result = await service._write_state(str(ObjectId()), started_at=datetime.utcnow(), status="running")
+
+        assert result is None
+
+    @pytest.mark.asyncio
+    async def test_started_at_is_kept_on_restart(self, test_db, mock_redis):
+        """Test a second RUNNING transition keeps the first start time"""
+        service = AnalysisService(test_db, mock_redis)
+        first_start = datetime(2024, 1, 15, 9, 30)
+        result = await test_db.analyses.insert_one({
+            "status": AnalysisStatus.PENDING.value,
+            "result_data": None
+        })
+        analysis_id = str(result.inserted_id)
+
+        try:
+            assert await service._write_state(analysis_id, started_at=first_start, status="running") == first_start
+
+            later = first_start + timedelta(minutes=5)
+            # $literal 保证以 $ 开头的字符串和字典值原样写入
+            returned = await service._write_state(
+                analysis_id,
+                started_at=later,
+                status="running",
+                result_data={"note": "$not_a_field"}
+            )
+
+            assert returned == first_start
+            doc = await test_db.analyses.find_one({"_id": result.inserted_id})
+            assert doc["started_at"] == first_start
+            assert doc["result_data"] == {"note": "$not_a_field"}
+        finally:
+            await test_db.analyses.delete_one({"_id": result.inserted_id})
+
+
+def make_pipeline_redis():
+    """Create a mock Redis client whose pipeline() records setex calls"""
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[])
+    redis = MagicMock()
+    redis.get = AsyncMock(return_value=None)
+    redis.pipeline.return_value.__aenter__ = AsyncMock(return_value=pipe)
+    redis.pipeline.return_value.__aexit__ = AsyncMock(return_value=False)
+    return redis, pipe
+
+
+def make_progress_db():
+    """Create a mock database for progress writes"""
+    db = MagicMock()
+    db.analyses.find_one = AsyncMock(return_value={"started_at": datetime.utcnow()})
+    db.analyses.bulk_write = AsyncMock()
+    return db
+
+
+class TestProgressBuffer:
+    """Test buffering, draining and discarding progress"""
+
+    @pytest.mark.asyncio
+    async def test_updates_within_interval_are_written_once(self, monkeypatch):
+        """Test several updates in one interval give one setex and one bulk_write op per analysis"""
+        monkeypatch.setattr(analysis_service_module, "PROGRESS_FLUSH_INTERVAL", 0.01)
+        redis, pipe = make_pipeline_redis()
+        db = make_progress_db()
+        service = AnalysisService(db, redis)
+        first_id = str(ObjectId())
+        second_id = str(ObjectId())
+
+        await service._update_progress(first_id, 10.0, "step 1", "数据验证")
+        await service._update_progress(second_id, 5.0, "step 1", "数据验证")
+        await service._update_progress(first_id, 20.0, "step 2", "参数配置")
+        await service._update_progress(first_id, 30.0, "step 3", "引擎初始化")
+        await service._flush_task
+
+        assert redis.pipeline.call_count == 1
+        assert pipe.setex.call_count == 2
+        written = {call.args[0]: json.loads(call.args[2]) for call in pipe.setex.call_args_list}
+        assert written[f"analysis_progress:{first_id}"]["progress"] == 30.0
+        assert written[f"analysis_progress:{first_id}"]["current_step_name"] == "引擎初始化"
+        assert written[f"analysis_progress:{second_id}"]["progress"] == 5.0
+        db.analyses.bulk_write.assert_awaited_once()
+        ops = db.analyses.bulk_write.call_args.args[0]
+        assert len(ops) == 2
+        # 开始时间每个分析只查询一次
+        assert db.analyses.find_one.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_updates_during_flush_are_picked_up(self, monkeypatch):
+        """Test progress arriving while a flush is running is written by the same task"""
+        monkeypatch.setattr(analysis_service_module, "PROGRESS_FLUSH_INTERVAL", 0.01)
+        redis, pipe = make_pipeline_redis()
+        db = make_progress_db()
+        service = AnalysisService(db, redis)
+        analysis_id = str(ObjectId())
+        executions = []
+
+        async def execute():
+            executions.append(len(executions))
+            if len(executions) == 1:
+                # 写入进行中到达的进度：任务仍在运行，不会创建新任务
+                await service._update_progress(analysis_id, 50.0, "later", "市场分析")
+            return []
+
+        pipe.execute = AsyncMock(side_effect=execute)
+
+        await service._update_progress(analysis_id, 40.0, "first", "股票识别")
+        flush_task = service._flush_task
+        await asyncio.wait_for(flush_task, timeout=1)
+
+        assert service._flush_task is flush_task
+        assert len(executions) == 2
+        assert json.loads(pipe.setex.call_args.args[2])["progress"] == 50.0
+        assert service._pending_progress == {}
+        assert service._pending_db_progress == {}
+
+    @pytest.mark.asyncio
+    async def test_drain_writes_only_finished_analysis(self):
+        """Test draining one analysis leaves other analyses' progress for the scheduled flush"""
+        redis, pipe = make_pipeline_redis()
+        db = MagicMock()
+        db.analyses.bulk_write = AsyncMock()
+        service = AnalysisService(db, redis)
+        finished_id = str(ObjectId())
+        other_id = str(ObjectId())
+        for analysis_id in (finished_id, other_id):
+            service._progress_cache[analysis_id] = {"progress": 50.0}
+            service._started_at[analysis_id] = datetime.utcnow()
+            service._pending_progress[analysis_id] = {"progress": 50.0}
+            service._pending_db_progress[analysis_id] = 50.0
+
+        await service._drain_progress(finished_id)
+
+        pipe.setex.assert_called_once()
+        assert pipe.setex.call_args.args[0] == f"analysis_progress:{finished_id}"
+        ops = db.analyses.bulk_write.call_args.args[0]
+        assert len(ops) == 1
+        assert other_id in service._pending_progress
+        assert other_id in service._pending_db_progress
+        assert finished_id not in service._progress_cache
+        assert finished_id not in service._started_at
+        assert other_id in service._progress_cache
+
+    @pytest.mark.asyncio
+    async def test_discard_evicts_without_writing(self):
+        """Test a cancelled analysis' buffered progress is dropped and nothing is written"""
+        redis, pipe = make_pipeline_redis()
+        db = MagicMock()
+        db.analyses.bulk_write = AsyncMock()
+        service = AnalysisService(db, redis)
+        analysis_id = str(ObjectId())
+        service._progress_cache[analysis_id] = {"progress": 10.0}
+        service._started_at[analysis_id] = datetime.utcnow()
+        service._pending_progress[analysis_id] = {"progress": 10.0}
+        service._pending_db_progress[analysis_id] = 10.0
+
+        service._discard_progress(analysis_id)
+
+        assert analysis_id not in service._progress_cache
+        assert analysis_id not in service._started_at
+        assert analysis_id not in service._pending_progress
+        assert analysis_id not in service._pending_db_progress
+        redis.pipeline.assert_not_called()
+        db.analyses.bulk_write.assert_not_called()
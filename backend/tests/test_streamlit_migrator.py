@@ -0,0 +1,139 @@
+"""
+Tests for Streamlit activity log parsing and the activity migration checkpoint
+"""
+import sys
+import json
+import pytest
+from pathlib import Path
+
+# 迁移脚本以脚本目录为导入根（from bulk import ...）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts" / "migration"))
+
+from ..scripts.migration.streamlit_data_migrator import (
+    ACTIVITY_CHECKPOINT_FILE,
+    StreamlitDataMigrator,
+    _parse_activity_file,
+)
+
+
+def write_activities(path: Path, activities: list) -> None:
+    """Write activities as a JSONL file"""
+    path.write_text("".join(json.dumps(activity) + "\n" for activity in activities), encoding="utf-8")
+
+
+@pytest.fixture
+def activities_dir(tmp_path):
+    """Create an empty user_activities directory under a web data dir"""
+    directory = tmp_path / "user_activities"
+    directory.mkdir()
+    return directory
+
+
+class TestParseActivityFile:
+    """Test single activity file parsing"""
+
+    def test_collects_users_and_stock_analysis_activities(self, tmp_path):
+        """Test user first/last seen, activity counts and the kept analysis activities"""
+        path = tmp_path / "user_activities_2024-01-15.jsonl"
+        write_activities(path, [
+            {"id": "a1", "username": "alice", "timestamp": 200, "action_name": "stock_analysis",
+             "details": {"stock_code": "AAPL"}},
+            {"username": "alice", "timestamp": 100, "action_name": "login"},
+            {"username": "bob", "timestamp": 300, "action_name": "Analysis",
+             "details": {"symbol": "00700"}, "success": False},
+            {"username": "bob", "timestamp": 400, "action_name": "stock_analysis", "details": {}},
+        ])
+
+        users_data, activities = _parse_activity_file(str(path))
+
+        assert users_data == {
+            "alice": {"first_seen": 100, "last_seen": 200, "activity_count": 2},
+            "bob": {"first_seen": 300, "last_seen": 400, "activity_count": 2},
+        }
+        assert [activity["stock_code"] for activity in activities] == ["AAPL", "00700"]
+        assert activities[0]["activity_id"] == "a1"
+        # 没有活动ID时以 文件名:行号 引用原始记录
+        assert activities[1]["activity_id"] == f"{path.name}:3"
+        assert activities[1]["success"] is False
+
+    def test_skips_blank_lines(self, tmp_path):
+        """Test blank lines are ignored and line numbers still match the file"""
+        path = tmp_path / "user_activities_2024-01-16.jsonl"
+        path.write_text(
+            "\n" + json.dumps({"username": "carol", "timestamp": 1, "action_name": "stock_analysis",
+                               "details": {"stock_code": "MSFT"}}) + "\n\n",
+            encoding="utf-8"
+        )
+
+        users_data, activities = _parse_activity_file(str(path))
+
+        assert users_data["carol"]["activity_count"] == 1
+        assert activities[0]["activity_id"] == f"{path.name}:2"
+
+    def test_accepts_nan_values(self, tmp_path):
+        """Test lines with NaN written by json.dumps are still parsed"""
+        path = tmp_path / "user_activities_2024-01-17.jsonl"
+        write_activities(path, [
+            {"username": "dave", "timestamp": 1, "action_name": "stock_analysis",
+             "details": {"stock_code": "TSLA", "score": float("nan")}},
+        ])
+
+        users_data, activities = _parse_activity_file(str(path))
+
+        assert users_data["dave"]["activity_count"] == 1
+        assert activities[0]["stock_code"] == "TSLA"
+
+
+class TestActivityCheckpoint:
+    """Test skipping activity files recorded in the checkpoint"""
+
+    @pytest.mark.asyncio
+    async def test_unchanged_files_are_skipped_after_checkpoint(self, activities_dir):
+        """Test a checkpointed file is skipped until its content changes"""
+        path = activities_dir / "user_activities_2024-01-15.jsonl"
+        write_activities(path, [
+            {"username": "alice", "timestamp": 100, "action_name": "stock_analysis",
+             "details": {"stock_code": "AAPL"}},
+        ])
+        migrator = StreamlitDataMigrator(web_data_dir=activities_dir.parent)
+
+        users_data, activities, scanned_files = await migrator._scan_activities()
+        assert list(users_data) == ["alice"]
+        assert len(activities) == 1
+        assert list(scanned_files) == [path.name]
+
+        migrator._save_activity_checkpoint(scanned_files)
+        assert (activities_dir / ACTIVITY_CHECKPOINT_FILE).exists()
+        assert migrator._load_activity_checkpoint() == scanned_files
+
+        users_data, activities, scanned_files = await migrator._scan_activities()
+        assert users_data == {}
+        assert activities == []
+        assert scanned_files == {}
+
+        # 文件追加写入后指纹改变，重新处理
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"username": "bob", "timestamp": 200, "action_name": "login"}) + "\n")
+
+        users_data, activities, scanned_files = await migrator._scan_activities()
+        assert set(users_data) == {"alice", "bob"}
+        assert list(scanned_files) == [path.name]
+
+    def test_save_merges_with_existing_checkpoint(self, activities_dir):
+        """Test saving a checkpoint keeps entries for files not scanned this run"""
+        migrator = StreamlitDataMigrator(web_data_dir=activities_dir.parent)
+
+        migrator._save_activity_checkpoint({"user_activities_2024-01-14.jsonl": [10, 1]})
+        migrator._save_activity_checkpoint({"user_activities_2024-01-15.jsonl": [20, 2]})
+
+        assert migrator._load_activity_checkpoint() == {
+            "user_activities_2024-01-14.jsonl": [10, 1],
+            "user_activities_2024-01-15.jsonl": [20, 2],
+        }
+
+    def test_corrupt_checkpoint_is_ignored(self, activities_dir):
+        """Test an unreadable checkpoint means every file is processed again"""
+        (activities_dir / ACTIVITY_CHECKPOINT_FILE).write_text("{not json", encoding="utf-8")
+        migrator = StreamlitDataMigrator(web_data_dir=activities_dir.parent)
+
+        assert migrator._load_activity_checkpoint() == {}
@@ -0,0 +1,311 @@
+"""
+Tests for upgrade/rollback backups, restores and service tracking
+"""
+import io
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tarfile
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ..scripts import upgrade_rollback
+from ..scripts.upgrade_rollback import (
+    BACKUP_ARCHIVE_NAME,
+    FINGERPRINT_IGNORED_NAMES,
+    SERVICES_PID_FILE,
+    UpgradeRollbackManager,
+    _copy_file_data,
+    _fastcopytree,
+    _tree_fingerprint,
+)
+
+
+@pytest.fixture
+def source_tree(tmp_path):
+    """Create a small directory tree with nested files"""
+    src = tmp_path / "src"
+    (src / "nested" / "deeper").mkdir(parents=True)
+    (src / "a.txt").write_bytes(b"alpha")
+    (src / "nested" / "b.bin").write_bytes(os.urandom(4096))
+    (src / "nested" / "deeper" / "c.txt").write_bytes(b"")
+    os.chmod(src / "a.txt", 0o640)
+    os.utime(src / "a.txt", ns=(1_000_000_000, 1_500_000_000))
+    return src
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """Create a manager whose project root is a temporary directory"""
+    root = tmp_path / "project"
+    root.mkdir()
+    monkeypatch.setattr(upgrade_rollback, "project_root", root)
+    return UpgradeRollbackManager()
+
+
+def tree_contents(root) -> dict:
+    """Map relative path -> file bytes for every file under root"""
+    contents = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                contents[os.path.relpath(path, root)] = f.read()
+    return contents
+
+
+class TestFastCopyTree:
+    """Test the scandir-based tree copy"""
+
+    def test_copies_contents_permissions_and_mtimes(self, source_tree, tmp_path):
+        """Test copied files match the source in content, mode and mtime"""
+        dst = tmp_path / "dst"
+
+        _fastcopytree(str(source_tree), str(dst))
+
+        assert tree_contents(dst) == tree_contents(source_tree)
+        src_stat = os.stat(source_tree / "a.txt")
+        dst_stat = os.stat(dst / "a.txt")
+        assert dst_stat.st_mode == src_stat.st_mode
+        assert dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+
+    def test_destination_must_not_exist(self, source_tree, tmp_path):
+        """Test copying onto an existing directory fails like shutil.copytree"""
+        dst = tmp_path / "dst"
+        dst.mkdir()
+
+        with pytest.raises(FileExistsError):
+            _fastcopytree(str(source_tree), str(dst))
+
+    def test_unchanged_files_are_hardlinked_from_link_base(self, source_tree, tmp_path):
+        """Test files unchanged since the previous backup are linked instead of copied"""
+        previous = tmp_path / "previous"
+        _fastcopytree(str(source_tree), str(previous))
+        # 修改一个文件，使其大小与上一次备份不同
+        (source_tree / "nested" / "b.bin").write_bytes(b"changed")
+        dst = tmp_path / "dst"
+
+        _fastcopytree(str(source_tree), str(dst), link_base=str(previous))
+
+        assert tree_contents(dst) == tree_contents(source_tree)
+        assert os.path.samefile(dst / "a.txt", previous / "a.txt")
+        assert not os.path.samefile(dst / "nested" / "b.bin", previous / "nested" / "b.bin")
+
+
+    @pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="requires named pipes")
+    def test_named_pipe_is_refused(self, source_tree, tmp_path):
+        """Test a FIFO in the tree raises instead of blocking on open"""
+        os.mkfifo(source_tree / "nested" / "pipe")
+
+        with pytest.raises(shutil.SpecialFileError):
+            _fastcopytree(str(source_tree), str(tmp_path / "dst"))
+
+
+class TestCopyFileData:
+    """Test the kernel copy fallbacks"""
+
+    def test_zero_from_first_copy_file_range_falls_back(self, tmp_path, monkeypatch):
+        """Test copy_file_range returning 0 at offset 0 does not produce an empty copy"""
+        if hasattr(os, "copy_file_range"):
+            monkeypatch.setattr(upgrade_rollback.os, "copy_file_range", lambda *args: 0)
+        src = tmp_path / "src.bin"
+        dst = tmp_path / "dst.bin"
+        data = os.urandom(100_000)
+        src.write_bytes(data)
+
+        src_fd = os.open(src, os.O_RDONLY)
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT)
+        try:
+            _copy_file_data(src_fd, dst_fd)
+        finally:
+            os.close(src_fd)
+            os.close(dst_fd)
+
+        assert dst.read_bytes() == data
+
+
+class TestTreeFingerprint:
+    """Test the directory tree change fingerprint"""
+
+    def test_stable_for_unchanged_tree(self, source_tree):
+        """Test the fingerprint is the same when nothing changed"""
+        assert _tree_fingerprint({"data": str(source_tree)}) == _tree_fingerprint({"data": str(source_tree)})
+
+    def test_changes_when_file_added_resized_or_touched(self, source_tree):
+        """Test adding, resizing or touching a file changes the fingerprint"""
+        roots = {"data": str(source_tree)}
+        fingerprints = {_tree_fingerprint(roots)}
+
+        (source_tree / "new.txt").write_bytes(b"new")
+        fingerprints.add(_tree_fingerprint(roots))
+
+        (source_tree / "a.txt").write_bytes(b"alpha and more")
+        fingerprints.add(_tree_fingerprint(roots))
+
+        os.utime(source_tree / "nested" / "deeper" / "c.txt", ns=(2_000_000_000, 2_000_000_000))
+        fingerprints.add(_tree_fingerprint(roots))
+
+        assert len(fingerprints) == 4
+
+    def test_root_name_is_part_of_the_fingerprint(self, source_tree):
+        """Test the same tree under a different root name gives a different fingerprint"""
+        assert _tree_fingerprint({"data": str(source_tree)}) != _tree_fingerprint({"web": str(source_tree)})
+
+    def test_missing_root_is_treated_as_empty(self, tmp_path):
+        """Test a missing directory fingerprints the same as an empty one"""
+        empty = tmp_path / "empty"
+        empty.mkdir()
+
+        assert _tree_fingerprint({"data": str(tmp_path / "missing")}) == _tree_fingerprint({"data": str(empty)})
+
+    def test_ignores_migration_checkpoint(self, source_tree):
+        """Test the migrator's checkpoint files do not change the fingerprint"""
+        roots = {"data": str(source_tree)}
+        before = _tree_fingerprint(roots)
+
+        for name in FINGERPRINT_IGNORED_NAMES:
+            (source_tree / name).write_text("{}", encoding="utf-8")
+
+        assert _tree_fingerprint(roots) == before
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires process groups")
+class TestStopNewServices:
+    """Test stopping services recorded by an earlier upgrade run"""
+
+    def start_service(self):
+        return subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"], start_new_session=True)
+
+    def test_stops_recorded_service(self, manager):
+        """Test a service whose start time matches the record is stopped"""
+        process = self.start_service()
+        try:
+            pid_file = manager.backup_dir / SERVICES_PID_FILE
+            pid_file.write_text(json.dumps({
+                "backend": {"pid": process.pid, "start_time": upgrade_rollback._process_start_time(process.pid)}
+            }))
+
+            assert manager._stop_new_services() is True
+
+            assert process.wait(timeout=5) is not None
+            assert not pid_file.exists()
+        finally:
+            process.kill()
+            process.wait()
+
+    def test_skips_reused_pid(self, manager):
+        """Test a PID now owned by a different process is not signalled"""
+        process = self.start_service()
+        try:
+            (manager.backup_dir / SERVICES_PID_FILE).write_text(json.dumps({
+                "backend": {"pid": process.pid, "start_time": "0"}
+            }))
+
+            assert manager._stop_new_services() is True
+
+            assert process.poll() is None
+        finally:
+            process.kill()
+            process.wait()
+
+    def test_failure_does_not_stop_other_services(self, manager, monkeypatch):
+        """Test an error stopping one service still stops the rest and keeps the PID file"""
+        stopped = []
+
+        def fake_stop(pid, process=None):
+            if pid == 1:
+                raise PermissionError("operation not permitted")
+            stopped.append(pid)
+
+        monkeypatch.setattr(upgrade_rollback, "_stop_process_group", fake_stop)
+        monkeypatch.setattr(upgrade_rollback, "_process_start_time", lambda pid: "42")
+        pid_file = manager.backup_dir / SERVICES_PID_FILE
+        pid_file.write_text(json.dumps({
+            "backend": {"pid": 1, "start_time": "42"},
+            "frontend": {"pid": 2, "start_time": "42"}
+        }))
+
+        assert manager._stop_new_services() is False
+
+        assert stopped == [2]
+        assert pid_file.exists()
+
+
+def add_member(tar, name, data=b"", **attrs):
+    """Add a regular file (or a member with the given attributes) to a tar stream"""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    for key, value in attrs.items():
+        setattr(info, key, value)
+    tar.addfile(info, io.BytesIO(data) if data else None)
+
+
+class TestArchiveBackup:
+    """Test tar.zst backup creation and restore"""
+
+    @pytest.fixture(autouse=True)
+    def require_zstandard(self):
+        pytest.importorskip("zstandard")
+
+    def test_backup_and_rollback_round_trip(self, manager, monkeypatch):
+        """Test data trees and configs are restored from the archive"""
+        monkeypatch.setattr(manager, "_start_old_services", lambda: True)
+        root = manager.project_root
+        (root / "web" / "data").mkdir(parents=True)
+        (root / "web" / "data" / "a.txt").write_bytes(b"web data")
+        (root / "data" / "nested").mkdir(parents=True)
+        (root / "data" / "nested" / "b.txt").write_bytes(b"analysis data")
+        (root / ".env").write_text("KEY=original\n")
+        web_before = tree_contents(root / "web" / "data")
+        data_before = tree_contents(root / "data")
+
+        backup_path = manager.create_backup()
+
+        assert (Path(backup_path) / BACKUP_ARCHIVE_NAME).exists()
+
+        # 模拟升级后的修改
+        (root / "web" / "data" / "a.txt").unlink()
+        (root / "data" / "new.txt").write_bytes(b"written after backup")
+        (root / ".env").write_text("KEY=changed\n")
+
+        assert manager.rollback_from_backup(backup_path) is True
+
+        assert tree_contents(root / "web" / "data") == web_before
+        assert tree_contents(root / "data") == data_before
+        assert (root / ".env").read_text() == "KEY=original\n"
+        # 被替换的目录在后台删除，回滚返回前已删除完毕
+        assert sorted(os.listdir(root)) == [".env", "data", "upgrade_backups", "web"]
+
+    def test_unsafe_members_are_skipped(self, manager, tmp_path):
+        """Test members with .. or absolute paths are skipped and safe members are renamed"""
+        import zstandard
+
+        archive_path = tmp_path / BACKUP_ARCHIVE_NAME
+        with open(archive_path, "wb") as f, \
+                zstandard.ZstdCompressor().stream_writer(f) as writer, \
+                tarfile.open(fileobj=writer, mode="w|") as tar:
+            add_member(tar, "analysis_data", type=tarfile.DIRTYPE, mode=0o755)
+            add_member(tar, "analysis_data/ok.txt", b"ok")
+            add_member(tar, "analysis_data/ok_link", type=tarfile.LNKTYPE, linkname="analysis_data/ok.txt")
+            add_member(tar, "analysis_data/../../evil.txt", b"evil")
+            add_member(tar, "configs/../../evil_config", b"evil")
+            add_member(tar, "/tmp/absolute_evil.txt", b"evil")
+            add_member(tar, "analysis_data/passwd", type=tarfile.SYMTYPE, linkname="/etc/passwd")
+            add_member(tar, "analysis_data/up", type=tarfile.SYMTYPE, linkname="../../outside")
+            add_member(tar, "configs/.env", b"KEY=restored\n")
+
+        root = manager.project_root
+        with ThreadPoolExecutor(max_workers=1) as cleanup:
+            manager._restore_backup_archive(archive_path, cleanup)
+
+        assert (root / "data" / "ok.txt").read_bytes() == b"ok"
+        assert (root / ".env").read_text() == "KEY=restored\n"
+        # 硬链接目标随成员一起从归档名称映射到恢复后的目录
+        assert os.path.samefile(root / "data" / "ok_link", root / "data" / "ok.txt")
+        assert sorted(os.listdir(root / "data")) == ["ok.txt", "ok_link"]
+        assert not (tmp_path / "evil.txt").exists()
+        assert not (tmp_path.parent / "evil_config").exists()
+        assert not os.path.exists("/tmp/absolute_evil.txt")